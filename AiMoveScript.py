@@ -1,18 +1,144 @@
+import atexit
+import os
+import queue
+import shutil
+import threading
+from contextlib import contextmanager
+
 import chess  # noqa: F401
 import chess.engine
-STOCKFISH_PATH = "C:\\Users\\jetsa\\OneDrive\\Desktop\\stockfish\\stockfish-windows-x86-64-avx2.exe"
+
+# Engine configuration comes from the environment, so the same code runs on any host:
+#   STOCKFISH_PATH       engine binary (default: "stockfish" found on PATH)
+#   STOCKFISH_POOL_SIZE  number of warm engine processes (default 2)
+#   STOCKFISH_THREADS    UCI Threads option per process (default 1)
+#   STOCKFISH_HASH_MB    UCI Hash option per process, in MB (default 16)
+STOCKFISH_PATH = os.environ.get("STOCKFISH_PATH") or shutil.which("stockfish")
+STOCKFISH_POOL_SIZE = int(os.environ.get("STOCKFISH_POOL_SIZE", 2))
+STOCKFISH_THREADS = int(os.environ.get("STOCKFISH_THREADS", 1))
+STOCKFISH_HASH_MB = int(os.environ.get("STOCKFISH_HASH_MB", 16))
+LEASE_TIMEOUT = 30.0  # seconds to wait for a free engine
+
+
+class PooledEngine:
+    """One UCI process plus the Skill Level it is currently configured with."""
+
+    def __init__(self, command, threads, hash_mb):
+        self.engine = chess.engine.SimpleEngine.popen_uci(command)
+        options = {}
+        if "Threads" in self.engine.options:
+            options["Threads"] = threads
+        if "Hash" in self.engine.options:
+            options["Hash"] = hash_mb
+        self.engine.configure(options)
+        self.skill_level = None
+
+    def set_skill_level(self, skill_level):
+        if skill_level != self.skill_level and "Skill Level" in self.engine.options:
+            self.engine.configure({"Skill Level": skill_level})
+        self.skill_level = skill_level
+
+    def is_alive(self):
+        try:
+            self.engine.ping()
+            return True
+        except (chess.engine.EngineError, chess.engine.EngineTerminatedError, OSError):
+            return False
+
+    def close(self):
+        try:
+            self.engine.quit()
+        except (chess.engine.EngineError, chess.engine.EngineTerminatedError, OSError):
+            self.engine.close()
+
+
+class EnginePool:
+    """
+    A fixed number of warm UCI engine processes. Each one is started and configured once
+    (Threads, Hash), leased to one request at a time, health-checked before every lease and
+    restarted if it has died. Skill Level is only sent when a lease asks for a different one.
+    Idle engines are handed out last in, first out, so an engine restarted after a crash is
+    the next one leased and a retry runs on it rather than on another process that may be dying.
+    """
+
+    def __init__(self, command=None, size=STOCKFISH_POOL_SIZE, threads=STOCKFISH_THREADS, hash_mb=STOCKFISH_HASH_MB):
+        self.command = command or STOCKFISH_PATH
+        if not self.command:
+            raise FileNotFoundError("No UCI engine configured: set STOCKFISH_PATH or put stockfish on PATH")
+        self.threads = threads
+        self.hash_mb = hash_mb
+        self.idle = queue.LifoQueue()
+        self.engines = []
+        for _ in range(size):
+            pooled = self.spawn()
+            self.engines.append(pooled)
+            self.idle.put(pooled)
+
+    def spawn(self):
+        return PooledEngine(self.command, self.threads, self.hash_mb)
+
+    def replace(self, pooled):
+        pooled.close()
+        fresh = self.spawn()
+        self.engines[self.engines.index(pooled)] = fresh
+        return fresh
+
+    @contextmanager
+    def lease(self, skill_level=None, timeout=LEASE_TIMEOUT):
+        """Borrow a healthy engine for one request: `with pool.lease(skill) as engine: ...`"""
+        pooled = self.idle.get(timeout=timeout)
+        try:
+            if not pooled.is_alive():
+                pooled = self.replace(pooled)
+            if skill_level is not None:
+                pooled.set_skill_level(skill_level)
+            yield pooled.engine
+        except chess.engine.EngineTerminatedError:
+            # The process crashed mid-request: restart it so the pool keeps its size; being
+            # returned last, the fresh engine is the one the next lease (the retry) gets
+            pooled = self.replace(pooled)
+            raise
+        finally:
+            self.idle.put(pooled)
+
+    def close(self):
+        for pooled in self.engines:
+            pooled.close()
+        self.engines = []
+
+
+_engine_pool = None
+_engine_pool_lock = threading.Lock()
+
+
+def getEnginePool():
+    """Return the shared engine pool, starting it on first use."""
+    global _engine_pool
+    with _engine_pool_lock:
+        if _engine_pool is None:
+            _engine_pool = EnginePool()
+            atexit.register(shutdownEnginePool)
+        return _engine_pool
+
+
+def shutdownEnginePool():
+    global _engine_pool
+    with _engine_pool_lock:
+        if _engine_pool is not None:
+            _engine_pool.close()
+            _engine_pool = None
 
 
 def findBestMoveStockfish(fen: str, time_limit=1.0, white_elo=1500, black_elo=1500):
     """
     Uses Stockfish to find the best move for a given FEN position with adjustable Elo ratings for white and black.
-    
+
     Args:
         fen (str): The FEN string representing the chessboard position.
         time_limit (float): Time limit for Stockfish's analysis in seconds.
         white_elo (int): The Elo rating for the white pieces.
         black_elo (int): The Elo rating for the black pieces.
-    
+
     Returns:
         str: The best move in UCI format (e.g., 'e2e4').
     """
@@ -32,10 +158,15 @@ def findBestMoveStockfish(fen: str, time_limit=1.0, white_elo=1500, black_elo=15
         else:
             skill_level = 20
 
-        with chess.engine.SimpleEngine.popen_uci(STOCKFISH_PATH) as engine:
-            engine.configure({"Skill Level": skill_level})
-            result = engine.play(board, chess.engine.Limit(time=time_limit))
-            return result.move.uci()
+        pool = getEnginePool()
+        for attempt in range(2):  # one retry if the engine crashes; the pool leases its restarted replacement next
+            try:
+                with pool.lease(skill_level) as engine:
+                    result = engine.play(board, chess.engine.Limit(time=time_limit))
+                    return result.move.uci()
+            except chess.engine.EngineTerminatedError:
+                if attempt == 1:
+                    raise
     except Exception as e:
         print(f"Error using Stockfish: {e}")
         return None
@@ -44,14 +175,14 @@ def findBestMoveStockfish(fen: str, time_limit=1.0, white_elo=1500, black_elo=15
 def adjustableBotElo(fen: str, white_elo: int, black_elo: int, time_limit=2.0):
     """
     Adjusts the bot's difficulty based on the Elo ratings for white and black.
-    
+
     Args:
         fen (str): The FEN string representing the chessboard position.
         white_elo (int): The Elo rating for the white pieces.
         black_elo (int): The Elo rating for the black pieces.
         time_limit (float): Time limit for Stockfish's analysis in seconds.
-    
+
     Returns:
         str: The best move in UCI format.
     """
-    return findBestMoveStockfish(fen, time_limit, white_elo, black_elo)
\ No newline at end of file
+    return findBestMoveStockfish(fen, time_limit, white_elo, black_elo)
@@ -1,9 +1,105 @@
+import atexit
 import chess
+import chess.polyglot
 import math
+import multiprocessing
+import os
 import random
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+
+import OpeningBook
+import Tablebase
 
 move_history = []
 
+# Transposition table bound types
+TT_EXACT = 0
+TT_LOWER = 1  # search failed high, the real score is at least the stored one
+TT_UPPER = 2  # search failed low, the real score is at most the stored one
+TT_SIZE_MB = 32
+TT_ENTRY_BYTES = 120  # rough size of one stored tuple with its key, score and move
+
+
+class TranspositionTable:
+    """
+    Fixed-size table of search results keyed on the Polyglot Zobrist hash of the board.
+    Each slot holds (key, depth, bound, score, best_move, generation). A slot is replaced
+    when the new result is searched at least as deep, or the old one is from an earlier search.
+    """
+
+    def __init__(self, max_megabytes=TT_SIZE_MB):
+        slots = max(1, max_megabytes * 1024 * 1024 // TT_ENTRY_BYTES)
+        self.size = 1 << (slots.bit_length() - 1)  # power of two, so the index is a mask
+        self.mask = self.size - 1
+        self.entries = [None] * self.size
+        self.generation = 0
+
+    def probe(self, key):
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    def store(self, key, depth, bound, score, best_move):
+        index = key & self.mask
+        old = self.entries[index]
+        if old is None or old[0] == key or depth >= old[1] or old[5] != self.generation:
+            self.entries[index] = (key, depth, bound, score, best_move, self.generation)
+
+    def new_search(self):
+        self.generation += 1
+
+    def clear(self):
+        self.entries = [None] * self.size
+        self.generation = 0
+
+
+transposition_table = TranspositionTable()
+tablebase = Tablebase.getTablebase()
+
+DEFAULT_TIME_LIMIT = 2.0  # seconds per move
+MAX_SEARCH_DEPTH = 32
+MATE_SCORE = 99999
+# Worker processes for findBestMove(workers=None); threads would share one core under the GIL
+SEARCH_WORKERS = int(os.environ.get("SEARCH_WORKERS", os.cpu_count() or 1))
+
+
+class SearchTimeout(Exception):
+    """Raised inside minimax when the current search runs out of time or nodes."""
+
+
+class SearchLimits:
+    """Wall-clock deadline, node budget and optional stop event shared by every node of one search."""
+
+    def __init__(self):
+        self.deadline = None
+        self.node_limit = None
+        self.nodes = 0
+        self.enabled = False
+        self.stop_event = None  # set in parallel search workers, so the parent can stop them
+
+    def start(self, time_limit=None, node_limit=None):
+        self.deadline = time.perf_counter() + time_limit if time_limit is not None else None
+        self.node_limit = node_limit
+        self.nodes = 0
+        self.enabled = False
+
+    def check(self):
+        self.nodes += 1
+        if not self.enabled:
+            return
+        if self.node_limit is not None and self.nodes >= self.node_limit:
+            raise SearchTimeout()
+        if self.nodes & 127 == 0:
+            if self.deadline is not None and time.perf_counter() >= self.deadline:
+                raise SearchTimeout()
+            if self.stop_event is not None and self.stop_event.is_set():
+                raise SearchTimeout()
+
+
+search_limits = SearchLimits()
+
 piece_values = {
     chess.PAWN: 100,
     chess.KNIGHT: 320,
@@ -41,31 +137,27 @@ piece_square_tables = {
 }
 
 def evaluate_board(board: chess.Board) -> int:
-    """Evaluate board with material, positional heuristics, and king safety."""
-    if board.is_checkmate():
-        return -99999 if board.turn else 99999
-    if board.is_stalemate() or board.is_insufficient_material():
-        return 0
-
+    """
+    Material and piece-square score, positive when white is better. Material comes from popcounts of
+    the piece bitboards and the tables only visit occupied squares. Checkmate and stalemate are left
+    to the search, which sees them as positions without legal moves.
+    """
     score = 0
-    for square in chess.SQUARES:
-        piece = board.piece_at(square)
-        if not piece:
+    white = board.occupied_co[chess.WHITE]
+    black = board.occupied_co[chess.BLACK]
+    for piece_type, value in piece_values.items():
+        pieces = board.pieces_mask(piece_type, chess.WHITE) | board.pieces_mask(piece_type, chess.BLACK)
+        if not pieces:
             continue
-
-        value = piece_values[piece.piece_type]
-        if piece.color == chess.WHITE:
-            score += value
-        else:
-            score -= value
-
-        pst = piece_square_tables.get(piece.piece_type)
+        score += value * (chess.popcount(pieces & white) - chess.popcount(pieces & black))
+        pst = piece_square_tables.get(piece_type)
         if pst:
-            index = square if piece.color == chess.WHITE else chess.square_mirror(square)
-            bonus = pst[index]
-            score += bonus if piece.color == chess.WHITE else -bonus
+            for square in chess.scan_forward(pieces & white):
+                score += pst[square]
+            for square in chess.scan_forward(pieces & black):
+                score -= pst[chess.square_mirror(square)]
 
-    king_position = board.king(chess.WHITE) if board.turn == chess.WHITE else board.king(chess.BLACK)
+    king_position = board.king(board.turn)
     score += center_control(king_position, board)
 
     return score
@@ -76,77 +168,397 @@ def center_control(king_square, board):
     return 10 if king_square in center_squares else 0
 
 
-def quiescence(board, alpha, beta):
-    """Extend search during unstable positions (e.g., captures)."""
+QUIESCENCE_DEPTH = 6
+MAX_PLY = 64
+# Tablebase wins rank below any mate the search sees but above every evaluation
+TB_WIN_SCORE = MATE_SCORE - 2 * MAX_PLY
+
+# Ordering bonuses, highest searched first. History scores stay below the killer band.
+TT_MOVE_BONUS = 1000000
+CAPTURE_BONUS = 100000
+PROMOTION_BONUS = 90000
+KILLER_BONUS = 80000
+HISTORY_MAX = KILLER_BONUS - 1
+
+# Two quiet moves per ply that recently caused a beta cutoff
+killer_moves = [[None, None] for _ in range(MAX_PLY)]
+# (color, from square, to square) -> how often and how deep that quiet move caused cutoffs
+history_table = {}
+
+
+def mvv_lva(board, move):
+    """Most valuable victim first, and among equal victims the least valuable attacker."""
+    victim = chess.PAWN if board.is_en_passant(move) else board.piece_type_at(move.to_square)
+    attacker = board.piece_type_at(move.from_square)
+    return victim * 10 - attacker
+
+
+def quiescence(board, alpha, beta, depth=0, max_depth=QUIESCENCE_DEPTH, ply=0):
+    """
+    Search captures only until the position is quiet, so leaves aren't scored mid-exchange.
+    In check every evasion is searched instead, which is also where checkmate is found;
+    a position with no captures is checked for stalemate before standing pat.
+    """
+    search_limits.check()
+    if board.is_check():
+        evasions = list(board.legal_moves)
+        if not evasions:
+            return mated_score(board, ply)
+        if depth >= max_depth:
+            return evaluate_board(board)
+        return search_evasions(board, evasions, alpha, beta, depth, max_depth, ply)
+
     stand_pat = evaluate_board(board)
-    if stand_pat >= beta:
-        return beta
-    if alpha < stand_pat:
-        alpha = stand_pat
+    if depth >= max_depth:
+        return stand_pat
 
-    for move in board.legal_moves:
-        if board.is_capture(move):
+    captures = sorted(board.generate_legal_captures(), key=lambda move: mvv_lva(board, move), reverse=True)
+    if not captures and not any(board.generate_legal_moves()):
+        return 0  # stalemate; any() stops at the first legal move, so quiet positions pay little
+    if board.turn == chess.WHITE:
+        if stand_pat >= beta:
+            return stand_pat
+        alpha = max(alpha, stand_pat)
+        for move in captures:
             board.push(move)
-            score = -quiescence(board, -beta, -alpha)
+            score = quiescence(board, alpha, beta, depth + 1, max_depth, ply + 1)
             board.pop()
-
             if score >= beta:
-                return beta
-            if score > alpha:
-                alpha = score
-    return alpha
-
-def order_moves(board):
-    """Order moves by capture and checks."""
-    captures = []
-    non_captures = []
+                return score
+            alpha = max(alpha, score)
+        return alpha
+    else:
+        if stand_pat <= alpha:
+            return stand_pat
+        beta = min(beta, stand_pat)
+        for move in captures:
+            board.push(move)
+            score = quiescence(board, alpha, beta, depth + 1, max_depth, ply + 1)
+            board.pop()
+            if score <= alpha:
+                return score
+            beta = min(beta, score)
+        return beta
+
+
+def search_evasions(board, evasions, alpha, beta, depth, max_depth, ply):
+    """Quiescence node in check: no standing pat, every legal evasion is searched."""
+    maximizing_player = board.turn == chess.WHITE
+    best = -math.inf if maximizing_player else math.inf
+    for move in evasions:
+        board.push(move)
+        score = quiescence(board, alpha, beta, depth + 1, max_depth, ply + 1)
+        board.pop()
+        if maximizing_player:
+            best = max(best, score)
+            alpha = max(alpha, score)
+        else:
+            best = min(best, score)
+            beta = min(beta, score)
+        if beta <= alpha:
+            break
+    return best
+
+
+def mated_score(board, ply):
+    """Score for the side to move being checkmated; nearer mates score further from zero."""
+    return -(MATE_SCORE - ply) if board.turn == chess.WHITE else MATE_SCORE - ply
+
+
+def order_moves(board, tt_move=None, ply=0):
+    """Order moves: TT move, MVV-LVA captures, promotions, killer moves, then quiet moves by history."""
+    killers = killer_moves[ply] if ply < MAX_PLY else (None, None)
+    scored = []
     for move in board.legal_moves:
-        if board.is_capture(move):
-            captures.append(move)
+        if move == tt_move:
+            score = TT_MOVE_BONUS
+        elif board.is_capture(move):
+            score = CAPTURE_BONUS + mvv_lva(board, move)
+        elif move.promotion:
+            score = PROMOTION_BONUS + move.promotion
+        elif move == killers[0]:
+            score = KILLER_BONUS + 1
+        elif move == killers[1]:
+            score = KILLER_BONUS
         else:
-            non_captures.append(move)
+            score = history_table.get((board.turn, move.from_square, move.to_square), 0)
+        scored.append((score, move))
+    scored.sort(key=lambda item: item[0], reverse=True)
+    return [move for _, move in scored]
+
 
-    # Order captures first
-    captures.sort(key=lambda move: board.piece_at(move.to_square).piece_type, reverse=True)
-    return captures + non_captures
+def record_cutoff(board, move, depth, ply):
+    """Remember a quiet move that caused a beta cutoff, as a killer for this ply and in the history table."""
+    if board.is_capture(move) or move.promotion:
+        return
+    if ply < MAX_PLY and killer_moves[ply][0] != move:
+        killer_moves[ply][1] = killer_moves[ply][0]
+        killer_moves[ply][0] = move
+    key = (board.turn, move.from_square, move.to_square)
+    history_table[key] = min(history_table.get(key, 0) + depth * depth, HISTORY_MAX)
+
+
+def reset_move_ordering():
+    """Clear killers and age the history table before a new search."""
+    for killers in killer_moves:
+        killers[0] = killers[1] = None
+    for key in history_table:
+        history_table[key] //= 2
+
+
+def tablebase_score(board, wdl, ply):
+    """Score a probed position from white's point of view; wins spoiled by the fifty-move rule count as draws."""
+    if wdl in (-1, 0, 1):
+        return 0
+    score = TB_WIN_SCORE - ply if wdl > 0 else -(TB_WIN_SCORE - ply)
+    return score if board.turn == chess.WHITE else -score
 
 
-def minimax(board, depth, alpha, beta, maximizing_player):
+def minimax(board, depth, alpha, beta, maximizing_player, ply=0):
     if depth == 0:
-        return evaluate_board(board), None
+        return quiescence(board, alpha, beta, ply=ply), None
+    search_limits.check()
+    if board.is_insufficient_material():
+        return 0, None
+    if ply > 0 and tablebase.covers(board):
+        wdl = tablebase.probeWdl(board)
+        if wdl is not None:
+            return tablebase_score(board, wdl, ply), None
+
+    # Leaves are never stored, so only interior nodes pay for hashing the board
+    key = chess.polyglot.zobrist_hash(board)
+    entry = transposition_table.probe(key)
+    tt_move = None
+    if entry is not None:
+        _, entry_depth, bound, score, tt_move, _ = entry
+        if entry_depth >= depth:
+            if bound == TT_EXACT:
+                return score, tt_move
+            if bound == TT_LOWER:
+                alpha = max(alpha, score)
+            else:
+                beta = min(beta, score)
+            if beta <= alpha:
+                return score, tt_move
+
+    alpha_orig, beta_orig = alpha, beta
+    moves = order_moves(board, tt_move, ply)
+    if not moves:  # checkmate or stalemate
+        return (mated_score(board, ply) if board.is_check() else 0), None
 
     best_move = None
     if maximizing_player:
-        max_eval = -math.inf
-        for move in board.legal_moves:
+        best_eval = -math.inf
+        for move in moves:
             board.push(move)
-            evaluation, _ = minimax(board, depth - 1, alpha, beta, False)
+            evaluation, _ = minimax(board, depth - 1, alpha, beta, False, ply + 1)
             board.pop()
-            if evaluation > max_eval:
-                max_eval = evaluation
+            if evaluation > best_eval:
+                best_eval = evaluation
                 best_move = move
             alpha = max(alpha, evaluation)
             if beta <= alpha:
+                record_cutoff(board, move, depth, ply)
                 break
-        return max_eval, best_move
     else:
-        min_eval = math.inf
-        for move in board.legal_moves:
+        best_eval = math.inf
+        for move in moves:
             board.push(move)
-            evaluation, _ = minimax(board, depth - 1, alpha, beta, True)
+            evaluation, _ = minimax(board, depth - 1, alpha, beta, True, ply + 1)
             board.pop()
-            if evaluation < min_eval:
-                min_eval = evaluation
+            if evaluation < best_eval:
+                best_eval = evaluation
                 best_move = move
             beta = min(beta, evaluation)
             if beta <= alpha:
+                record_cutoff(board, move, depth, ply)
                 break
-        return min_eval, best_move
 
-def findBestMove(fen: str):
+    if best_move is not None:
+        if best_eval <= alpha_orig:
+            bound = TT_UPPER
+        elif best_eval >= beta_orig:
+            bound = TT_LOWER
+        else:
+            bound = TT_EXACT
+        transposition_table.store(key, depth, bound, best_eval, best_move)
+    return best_eval, best_move
+
+# Root-parallel search. The parent owns the pool; each worker process gets the shared bound and
+# stop event from _init_search_worker and keeps its own transposition table between tasks.
+_search_pool = None
+_search_pool_workers = 0
+_shared_bound = None  # best exact root score of the current iteration, from the side to move's view
+_stop_event = None
+_search_id = 0
+_worker_search_id = None
+
+
+def _init_search_worker(shared_bound, stop_event):
+    global _shared_bound, _stop_event
+    _shared_bound = shared_bound
+    _stop_event = stop_event
+    search_limits.stop_event = stop_event
+
+
+def get_search_pool(workers):
+    """Return the shared process pool, (re)starting it with the given number of workers."""
+    global _search_pool, _search_pool_workers, _shared_bound, _stop_event
+    if _search_pool is None or _search_pool_workers != workers:
+        shutdown_search_pool()
+        _shared_bound = multiprocessing.Value('d', -math.inf)
+        _stop_event = multiprocessing.Event()
+        _search_pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_search_worker,
+                                           initargs=(_shared_bound, _stop_event))
+        _search_pool_workers = workers
+    return _search_pool
+
+
+def shutdown_search_pool():
+    global _search_pool, _search_pool_workers
+    if _search_pool is not None:
+        _search_pool.shutdown(cancel_futures=True)
+        _search_pool = None
+        _search_pool_workers = 0
+
+
+atexit.register(shutdown_search_pool)
+
+
+def _search_root_move(fen, uci, depth, search_id):
+    """
+    Worker task: search one root move to depth with the best root score found so far as the bound.
+    Returns (uci, score, exact) with the score from the root side's point of view, or None if stopped.
+    A score that does not beat the bound is only an upper bound, so it is returned with exact=False.
+    """
+    global _worker_search_id
+    if search_id != _worker_search_id:
+        transposition_table.new_search()
+        reset_move_ordering()
+        _worker_search_id = search_id
     board = chess.Board(fen)
-    _, best_move = minimax(board, depth=4, alpha=-math.inf, beta=math.inf, maximizing_player=board.turn)
-    
+    root_white = board.turn == chess.WHITE
+    board.push_uci(uci)
+    bound = _shared_bound.value
+    alpha, beta = (bound, math.inf) if root_white else (-math.inf, -bound)
+    search_limits.start()
+    search_limits.enabled = depth > 1  # depth 1 always completes, as in the serial search
+    try:
+        score, _ = minimax(board, depth - 1, alpha, beta, not root_white, ply=1)
+    except SearchTimeout:
+        return None
+    score = score if root_white else -score
+    if score <= bound:
+        return uci, score, False
+    with _shared_bound.get_lock():
+        if score > _shared_bound.value:
+            _shared_bound.value = score
+    return uci, score, True
+
+
+def _search_root(pool, fen, root_moves, depth, deadline):
+    """
+    Search every root move to depth across the pool. The first move (the previous iteration's best)
+    runs alone so the rest start with its score as their bound. Returns ({uci: (score, exact)}, complete).
+    """
+    _shared_bound.value = -math.inf
+    _stop_event.clear()
+
+    def remaining():
+        return None if deadline is None else max(0.0, deadline - time.perf_counter())
+
+    def collect(futures):
+        done, pending = wait(futures, timeout=remaining())
+        if pending:
+            _stop_event.set()
+            for future in pending:
+                future.cancel()
+            wait(futures)  # running tasks see the stop event and return None
+        return [future.result() for future in futures if not future.cancelled() and future.result()], not pending
+
+    first, complete = collect([pool.submit(_search_root_move, fen, root_moves[0], depth, _search_id)])
+    if not complete or not first:
+        return {}, False
+    rest, complete = collect([pool.submit(_search_root_move, fen, uci, depth, _search_id) for uci in root_moves[1:]])
+    return {uci: (score, exact) for uci, score, exact in first + rest}, complete
+
+
+def find_best_move_parallel(board, workers, time_limit=DEFAULT_TIME_LIMIT, max_depth=MAX_SEARCH_DEPTH):
+    """
+    Root-parallel iterative deepening: each iteration splits the root moves across worker processes,
+    which share the best exact root score as their alpha bound. An iteration cut short by the time
+    limit still counts if the previous best move finished, since every other finished move was
+    compared with it. Returns a chess.Move, or None if there are no legal moves.
+    """
+    global _search_id
+    pool = get_search_pool(workers)
+    _search_id += 1
+    deadline = time.perf_counter() + time_limit if time_limit is not None else None
+    fen = board.fen()
+    root_moves = [move.uci() for move in order_moves(board)]
+    best_move = None
+    for depth in range(1, max_depth + 1):
+        results, complete = _search_root(pool, fen, root_moves, depth, deadline if depth > 1 else None)
+        exact = [uci for uci in root_moves if uci in results and results[uci][1]]
+        if not exact:
+            break
+        # max keeps the earliest of equal scores, so the result only depends on the move order
+        best_uci = max(exact, key=lambda uci: results[uci][0])
+        best_move = chess.Move.from_uci(best_uci)
+        if not complete or abs(results[best_uci][0]) >= MATE_SCORE - MAX_PLY:
+            break
+        root_moves.sort(key=lambda uci: (uci != best_uci, -results[uci][0]))
+    return best_move
+
+
+def findBestMove(fen: str, time_limit=DEFAULT_TIME_LIMIT, node_limit=None, max_depth=MAX_SEARCH_DEPTH, workers=1,
+                 use_book=True):
+    """
+    Iterative deepening: search depth 1, 2, 3... until time_limit seconds or node_limit nodes are
+    used up, and play the best move of the deepest completed iteration. Each iteration leaves its
+    principal variation in the transposition table, so the next one searches those moves first.
+    With workers > 1 the root moves are searched in parallel processes (node_limit is not used);
+    workers=1 (the default) searches in this process and is deterministic; workers=None asks for
+    SEARCH_WORKERS processes, or a single worker when a node_limit is given.
+    Positions found in the opening book (see OpeningBook) or the endgame tablebases (see Tablebase)
+    are answered from them without a search.
+    """
+    board = chess.Board(fen)
+    if use_book:
+        book_move = OpeningBook.findBookMove(board)
+        if book_move is not None:
+            return book_move.uci()
+    if tablebase.covers(board):
+        tablebase_move = tablebase.bestMove(board)
+        if tablebase_move is not None:
+            return tablebase_move.uci()
+    if workers is None:
+        workers = SEARCH_WORKERS if node_limit is None else 1
+    if workers > 1:
+        best_move = find_best_move_parallel(board, workers, time_limit, max_depth)
+        return _record_move(board, best_move)
+
+    transposition_table.new_search()
+    reset_move_ordering()
+    search_limits.start(time_limit, node_limit)
+    best_move = None
+    for depth in range(1, max_depth + 1):
+        try:
+            score, move = minimax(board, depth, -math.inf, math.inf, board.turn)
+        except SearchTimeout:
+            while board.move_stack:  # unwind the moves the aborted iteration left on the board
+                board.pop()
+            break
+        # Depth 1 always runs to completion, so there is a move to fall back on
+        search_limits.enabled = True
+        best_move = move
+        if move is None or abs(score) >= MATE_SCORE - MAX_PLY:
+            break
+    return _record_move(board, best_move)
+
+
+def _record_move(board, best_move):
+    """Avoid replaying a move from move_history, remember the chosen one and return it as UCI."""
     if best_move in move_history:
         legal_moves = list(board.legal_moves)
         best_move = random.choice(legal_moves) if legal_moves else None
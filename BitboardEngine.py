@@ -0,0 +1,495 @@
+"""
+Bitboard move generator backend for ChessEngine.GameState.
+
+Squares are numbered row * 8 + col, matching the GameState board (row 0 is rank 8),
+and each of the 12 pieces is kept as one int with a bit set for every square it occupies.
+Moves are generated as 16 bit move codes. Move objects are only built at the getValidMoves
+edge. BitboardBackend.perft plays codes on the bitboards directly and counts the last ply
+with popcounts, to benchmark the generator on its own.
+"""
+from ChessEngine import Move, MOVE_CASTLE, MOVE_ENPASSANT, MOVE_PROMOTION, PROMOTION_PIECES, WHITE_KINGSIDE, \
+    WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE, CASTLING_SQUARE_MASKS
+
+PIECES = ('wp', 'wR', 'wN', 'wB', 'wQ', 'wK', 'bp', 'bR', 'bN', 'bB', 'bQ', 'bK')
+SQUARES = [(sq // 8, sq % 8) for sq in range(64)]
+
+ROOK_DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1))
+BISHOP_DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+
+
+def _stepTable(steps):
+    table = []
+    for r, c in SQUARES:
+        bb = 0
+        for dr, dc in steps:
+            if 0 <= r + dr < 8 and 0 <= c + dc < 8:
+                bb |= 1 << ((r + dr) * 8 + c + dc)
+        table.append(bb)
+    return table
+
+
+def _rayTable(d):
+    table = []
+    for r, c in SQUARES:
+        bb = 0
+        endRow, endCol = r + d[0], c + d[1]
+        while 0 <= endRow < 8 and 0 <= endCol < 8:
+            bb |= 1 << (endRow * 8 + endCol)
+            endRow, endCol = endRow + d[0], endCol + d[1]
+        table.append(bb)
+    return table
+
+
+KNIGHT_ATTACKS = _stepTable(((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)))
+KING_ATTACKS = _stepTable(((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)))
+# Squares attacked by a pawn of the given color standing on each square
+PAWN_ATTACKS = {'w': _stepTable(((-1, -1), (-1, 1))), 'b': _stepTable(((1, -1), (1, 1)))}
+# RAYS[d][sq] holds every square from sq towards the edge of the board in direction d.
+# A direction is "positive" when it walks towards higher square numbers, so the nearest
+# blocker on the ray is its lowest set bit, otherwise its highest set bit.
+RAYS = {d: _rayTable(d) for d in ROOK_DIRECTIONS + BISHOP_DIRECTIONS}
+POSITIVE = {d: d[0] * 8 + d[1] > 0 for d in RAYS}
+FULL = (1 << 64) - 1
+ROW_MASKS = [0xFF << (row * 8) for row in range(8)]
+FILE_MASKS = [sum(1 << (row * 8 + col) for row in range(8)) for col in range(8)]
+# Move.moveID for each start | end << 6, so Move objects can be built without Move.__init__
+MOVE_IDS = [(start >> 3) * 1000 + (start & 7) * 100 + (end >> 3) * 10 + (end & 7)
+            for end in range(64) for start in range(64)]
+
+
+def firstBlocker(d, bb):
+    if POSITIVE[d]:
+        return (bb & -bb).bit_length() - 1
+    return bb.bit_length() - 1
+
+
+def rayAttacks(d, sq, occupied):
+    """Squares attacked from sq in direction d, up to and including the first blocker."""
+    ray = RAYS[d][sq]
+    blockers = ray & occupied
+    if blockers:
+        ray ^= RAYS[d][firstBlocker(d, blockers)]
+    return ray
+
+
+def _slidingTables(directions):
+    """
+    For every square, the relevant blocker mask (rays without their last square) and a dict from
+    each subset of that mask to the attacked squares. The dict plays the part of a magic
+    multiplication: one lookup replaces walking every ray.
+    """
+    masks, tables = [], []
+    for sq, (r, c) in enumerate(SQUARES):
+        mask = 0
+        for d in directions:
+            lastRow, lastCol = r + d[0], c + d[1]
+            while 0 <= lastRow + d[0] < 8 and 0 <= lastCol + d[1] < 8:
+                mask |= 1 << (lastRow * 8 + lastCol)
+                lastRow, lastCol = lastRow + d[0], lastCol + d[1]
+        table = {}
+        subset = 0
+        while True:
+            attacks = 0
+            for d in directions:
+                attacks |= rayAttacks(d, sq, subset)
+            table[subset] = attacks
+            subset = (subset - mask) & mask
+            if subset == 0:
+                break
+        masks.append(mask)
+        tables.append(table)
+    return masks, tables
+
+
+ROOK_MASKS, ROOK_TABLES = _slidingTables(ROOK_DIRECTIONS)
+BISHOP_MASKS, BISHOP_TABLES = _slidingTables(BISHOP_DIRECTIONS)
+
+
+class BitboardBackend():
+
+    def __init__(self, gs):
+        self.gs = gs
+        self.pieceAt = ["--"] * 64
+        self.pieces = dict.fromkeys(PIECES, 0)
+        self.occupancy = {'w': 0, 'b': 0}
+        self.inCheck = False
+        for sq, (r, c) in enumerate(SQUARES):
+            self.setSquare(sq, gs.board[r][c])
+        self.syncState()
+
+    def syncState(self):
+        """Copy the side to move, castling rights and en passant square from the GameState."""
+        gs = self.gs
+        self.whiteToMove = gs.whiteToMove
+        self.castlingRights = gs.castlingRights
+        self.enpassantSq = gs.enpassantPossible[0] * 8 + gs.enpassantPossible[1] if gs.enpassantPossible != () else -1
+
+    def setSquare(self, sq, piece):
+        old = self.pieceAt[sq]
+        if old == piece:
+            return
+        bit = 1 << sq
+        if old != "--":
+            self.pieces[old] ^= bit
+            self.occupancy[old[0]] ^= bit
+        if piece != "--":
+            self.pieces[piece] ^= bit
+            self.occupancy[piece[0]] ^= bit
+        self.pieceAt[sq] = piece
+
+    def updateSquares(self, move):
+        """Re-read the squares a move touches from the GameState board, after makeMove or undoMove."""
+        board = self.gs.board
+        squares = [(move.startRow, move.startCol), (move.endRow, move.endCol)]
+        if move.isEnpassantMove:
+            squares.append((move.startRow, move.endCol))
+        if move.isCastleMove:
+            squares += [(move.endRow, 0), (move.endRow, 3), (move.endRow, 5), (move.endRow, 7)]
+        for r, c in squares:
+            self.setSquare(r * 8 + c, board[r][c])
+        self.syncState()
+
+    def makeCode(self, code):
+        """
+        Play a move code on the bitboards alone, leaving the GameState untouched, and return
+        the record undoCode needs. Used by perft, which never needs Move objects.
+        """
+        start = code & 63
+        end = code >> 6 & 63
+        flags = code >> 12
+        pieceAt = self.pieceAt
+        moved = pieceAt[start]
+        record = (code, pieceAt[end], self.castlingRights, self.enpassantSq)
+        self.setSquare(start, "--")
+        if flags & MOVE_PROMOTION:
+            self.setSquare(end, moved[0] + PROMOTION_PIECES[flags & 3])
+        else:
+            self.setSquare(end, moved)
+            if flags == MOVE_ENPASSANT:
+                self.setSquare(start & 56 | end & 7, "--")
+            elif flags == MOVE_CASTLE:
+                rookStart, rookEnd = (end + 1, end - 1) if end > start else (end - 2, end + 1)
+                self.setSquare(rookEnd, pieceAt[rookStart])
+                self.setSquare(rookStart, "--")
+        self.enpassantSq = (start + end) >> 1 if moved[1] == 'p' and abs(end - start) == 16 else -1
+        self.castlingRights &= CASTLING_SQUARE_MASKS[start] & CASTLING_SQUARE_MASKS[end]
+        self.whiteToMove = not self.whiteToMove
+        return record
+
+    def undoCode(self, record):
+        code, captured, self.castlingRights, self.enpassantSq = record
+        start = code & 63
+        end = code >> 6 & 63
+        flags = code >> 12
+        pieceAt = self.pieceAt
+        moved = pieceAt[end]
+        if flags & MOVE_PROMOTION:
+            moved = moved[0] + 'p'
+        elif flags == MOVE_ENPASSANT:
+            self.setSquare(start & 56 | end & 7, 'bp' if moved == 'wp' else 'wp')
+        elif flags == MOVE_CASTLE:
+            rookStart, rookEnd = (end + 1, end - 1) if end > start else (end - 2, end + 1)
+            self.setSquare(rookStart, pieceAt[rookEnd])
+            self.setSquare(rookEnd, "--")
+        self.setSquare(end, captured)
+        self.setSquare(start, moved)
+        self.whiteToMove = not self.whiteToMove
+
+    def perft(self, depth):
+        """
+        Perft on move codes alone, with no Move objects and no GameState bookkeeping below the root.
+        This measures the raw generator only; GameState.perft is the one that checks makeMove/undoMove.
+        """
+        if depth <= 1:
+            return self.countMoves() if depth == 1 else 1
+        nodes = 0
+        for code in self.getMoveCodes():
+            record = self.makeCode(code)
+            nodes += self.perft(depth - 1)
+            self.undoCode(record)
+        return nodes
+
+    def squareUnderAttack(self, sq, enemyColor, occupied):
+        pieces = self.pieces
+        allyColor = 'b' if enemyColor == 'w' else 'w'
+        if KNIGHT_ATTACKS[sq] & pieces[enemyColor + 'N'] or KING_ATTACKS[sq] & pieces[enemyColor + 'K'] or \
+           PAWN_ATTACKS[allyColor][sq] & pieces[enemyColor + 'p']:
+            return True
+        rooks = pieces[enemyColor + 'R'] | pieces[enemyColor + 'Q']
+        if rooks and ROOK_TABLES[sq][occupied & ROOK_MASKS[sq]] & rooks:
+            return True
+        bishops = pieces[enemyColor + 'B'] | pieces[enemyColor + 'Q']
+        if bishops and BISHOP_TABLES[sq][occupied & BISHOP_MASKS[sq]] & bishops:
+            return True
+        return False
+
+    def attackedSquares(self, enemyColor, occupied):
+        """Every square attacked by an enemy piece, with sliders blocked by occupied."""
+        pieces = self.pieces
+        pawns = pieces[enemyColor + 'p']
+        if enemyColor == 'w':
+            attacks = (pawns & ~FILE_MASKS[0]) >> 9 | (pawns & ~FILE_MASKS[7]) >> 7
+        else:
+            attacks = ((pawns & ~FILE_MASKS[0]) << 7 | (pawns & ~FILE_MASKS[7]) << 9) & FULL
+        attacks |= KING_ATTACKS[pieces[enemyColor + 'K'].bit_length() - 1]
+        knights = pieces[enemyColor + 'N']
+        while knights:
+            bit = knights & -knights
+            knights ^= bit
+            attacks |= KNIGHT_ATTACKS[bit.bit_length() - 1]
+        queens = pieces[enemyColor + 'Q']
+        rooks = pieces[enemyColor + 'R'] | queens
+        while rooks:
+            bit = rooks & -rooks
+            rooks ^= bit
+            sq = bit.bit_length() - 1
+            attacks |= ROOK_TABLES[sq][occupied & ROOK_MASKS[sq]]
+        bishops = pieces[enemyColor + 'B'] | queens
+        while bishops:
+            bit = bishops & -bishops
+            bishops ^= bit
+            sq = bit.bit_length() - 1
+            attacks |= BISHOP_TABLES[sq][occupied & BISHOP_MASKS[sq]]
+        return attacks
+
+    def checkForPinsAndChecks(self, kingSq, allyColor, enemyColor, occupied):
+        """
+        Return the checking pieces, the squares a non-king move must land on to resolve check,
+        and a dict of pinned square -> squares that piece may still move to.
+        """
+        pieces = self.pieces
+        allies = self.occupancy[allyColor]
+        checkers = (KNIGHT_ATTACKS[kingSq] & pieces[enemyColor + 'N']) | \
+                   (PAWN_ATTACKS[allyColor][kingSq] & pieces[enemyColor + 'p'])
+        checkMask = checkers
+        pins = {}
+        for directions, sliders in ((ROOK_DIRECTIONS, pieces[enemyColor + 'R'] | pieces[enemyColor + 'Q']),
+                                    (BISHOP_DIRECTIONS, pieces[enemyColor + 'B'] | pieces[enemyColor + 'Q'])):
+            if not sliders:
+                continue
+            for d in directions:
+                ray = RAYS[d][kingSq]
+                if not ray & sliders:
+                    continue
+                blockers = ray & occupied
+                first = firstBlocker(d, blockers)
+                firstBit = 1 << first
+                if firstBit & sliders:
+                    checkers |= firstBit
+                    checkMask |= ray ^ RAYS[d][first]
+                elif firstBit & allies:
+                    blockers ^= firstBit
+                    if blockers:
+                        second = firstBlocker(d, blockers)
+                        if (1 << second) & sliders:
+                            pins[first] = ray ^ RAYS[d][second]
+        if not checkers:
+            checkMask = FULL
+        return checkers, checkMask, pins
+
+    def getValidMoves(self):
+        """The legal moves as Move objects, filled in straight from the move codes and pieceAt."""
+        pieceAt = self.pieceAt
+        newMove = object.__new__
+        moves = []
+        for code in self.getMoveCodes():
+            start = code & 63
+            end = code >> 6 & 63
+            flags = code >> 12
+            move = newMove(Move)
+            move.startRow, move.startCol = SQUARES[start]
+            move.endRow, move.endCol = SQUARES[end]
+            move.pieceMoved = moved = pieceAt[start]
+            captured = pieceAt[end]
+            move.moveID = MOVE_IDS[code & 4095]
+            move.promotionPiece = 'Q'
+            move.pawnPromotion = move.isEnpassantMove = move.isCastleMove = False
+            if flags & MOVE_PROMOTION:
+                move.pawnPromotion = True
+                move.promotionPiece = PROMOTION_PIECES[flags & 3]
+                move.moveID += (flags & 3) * 10000
+            elif flags == MOVE_ENPASSANT:
+                move.isEnpassantMove = True
+                captured = 'wp' if moved == 'bp' else 'bp'
+            elif flags == MOVE_CASTLE:
+                move.isCastleMove = True
+            move.pieceCaptured = captured
+            move.isCapture = captured != "--"
+            moves.append(move)
+        return moves
+
+    def getMoveCodes(self):
+        """The legal moves as move codes (see ChessEngine.Move.code)."""
+        moves = []
+        self.generateMoves(moves)
+        return moves
+
+    def countMoves(self):
+        """
+        The number of legal moves, from popcounts of the target sets instead of a move list.
+        perft uses it for the last ply, where the moves themselves are never looked at.
+        """
+        return self.generateMoves(None)
+
+    def generateMoves(self, moves):
+        """Append the legal move codes to moves, or with moves=None only count them. Returns the number of moves."""
+        pieces = self.pieces
+        count = 0
+        listed = [] if moves is None else moves  # moves that are always produced one by one
+        if self.whiteToMove:
+            allyColor, enemyColor = 'w', 'b'
+        else:
+            allyColor, enemyColor = 'b', 'w'
+        allies = self.occupancy[allyColor]
+        enemies = self.occupancy[enemyColor]
+        occupied = allies | enemies
+        kingBit = pieces[allyColor + 'K']
+        kingSq = kingBit.bit_length() - 1
+        checkers, checkMask, pins = self.checkForPinsAndChecks(kingSq, allyColor, enemyColor, occupied)
+        self.inCheck = checkers != 0
+
+        # King moves, against the enemy attacks with the king lifted off the board so it cannot hide
+        # behind itself. Without check, only a king standing in the way could block an attack on the
+        # castling squares, so the same set serves for castling.
+        attacked = self.attackedSquares(enemyColor, occupied ^ kingBit)
+        targets = KING_ATTACKS[kingSq] & ~allies & ~attacked
+        if moves is None:
+            count += targets.bit_count()
+        else:
+            self.addMoves(kingSq, targets, moves)
+        if not checkers:
+            self.getCastleMoves(kingSq, allyColor, occupied, attacked, listed)
+        elif checkers & (checkers - 1):
+            return count + len(listed)  # double check, only the king can move
+
+        # Knights (a pinned knight can never move)
+        targetMask = ~allies & checkMask
+        knights = pieces[allyColor + 'N']
+        while knights:
+            bit = knights & -knights
+            knights ^= bit
+            sq = bit.bit_length() - 1
+            if sq in pins:
+                continue
+            if moves is None:
+                count += (KNIGHT_ATTACKS[sq] & targetMask).bit_count()
+            else:
+                self.addMoves(sq, KNIGHT_ATTACKS[sq] & targetMask, moves)
+
+        # Sliders, with a queen handled once as a rook and once as a bishop
+        queens = pieces[allyColor + 'Q']
+        for sliders, masks, tables in ((pieces[allyColor + 'R'] | queens, ROOK_MASKS, ROOK_TABLES),
+                                       (pieces[allyColor + 'B'] | queens, BISHOP_MASKS, BISHOP_TABLES)):
+            while sliders:
+                bit = sliders & -sliders
+                sliders ^= bit
+                sq = bit.bit_length() - 1
+                targets = tables[sq][occupied & masks[sq]] & targetMask
+                if sq in pins:
+                    targets &= pins[sq]
+                if moves is None:
+                    count += targets.bit_count()
+                else:
+                    self.addMoves(sq, targets, moves)
+
+        pawns = pieces[allyColor + 'p']
+        if moves is None:
+            # Unpinned pawns are counted set-wise; pinned ones go through the per-pawn generator below
+            pinned = 0
+            for sq in pins:
+                pinned |= 1 << sq
+            count += self.countPawnMoves(pawns & ~pinned, allyColor, enemies, occupied, checkMask)
+            self.getEnpassantMoves(pawns & ~pinned, allyColor, enemyColor, occupied, kingSq, pins, listed)
+            pawns &= pinned
+        self.getPawnMoves(pawns, allyColor, enemyColor, enemies, occupied, kingSq, checkMask, pins, listed)
+        return count + len(listed)
+
+    def addMoves(self, sq, targets, moves):
+        while targets:
+            bit = targets & -targets
+            targets ^= bit
+            moves.append(sq | (bit.bit_length() - 1) << 6)
+
+    def countPawnMoves(self, pawns, allyColor, enemies, occupied, checkMask):
+        """Pushes and captures of unpinned pawns, shifting the whole set at once. En passant is left out."""
+        empty = ~occupied & FULL
+        if allyColor == 'w':
+            single = (pawns >> 8) & empty
+            double = ((single & ROW_MASKS[5]) >> 8) & empty
+            left = ((pawns & ~FILE_MASKS[0]) >> 9) & enemies
+            right = ((pawns & ~FILE_MASKS[7]) >> 7) & enemies
+            backRow = ROW_MASKS[0]
+        else:
+            single = (pawns << 8) & empty
+            double = ((single & ROW_MASKS[2]) << 8) & empty
+            left = ((pawns & ~FILE_MASKS[0]) << 7) & enemies
+            right = ((pawns & ~FILE_MASKS[7]) << 9) & enemies
+            backRow = ROW_MASKS[7]
+        count = (double & checkMask).bit_count()
+        for targets in (single & checkMask, left & checkMask, right & checkMask):
+            count += (targets & ~backRow).bit_count() + 4 * (targets & backRow).bit_count()  # four promotions
+        return count
+
+    def getPawnMoves(self, pawns, allyColor, enemyColor, enemies, occupied, kingSq, checkMask, pins, moves):
+        if allyColor == 'w':
+            moveAmount, startRow, backRow = -8, 6, 0
+        else:
+            moveAmount, startRow, backRow = 8, 1, 7
+        self.getEnpassantMoves(pawns, allyColor, enemyColor, occupied, kingSq, pins, moves)
+        while pawns:
+            bit = pawns & -pawns
+            pawns ^= bit
+            sq = bit.bit_length() - 1
+            allowed = checkMask & pins.get(sq, FULL)
+            oneStep = sq + moveAmount
+            if not (1 << oneStep) & occupied:
+                if (1 << oneStep) & allowed:
+                    self.addPawnMove(sq, oneStep, backRow, moves)
+                twoStep = oneStep + moveAmount
+                if sq >> 3 == startRow and not (1 << twoStep) & occupied and (1 << twoStep) & allowed:
+                    moves.append(sq | twoStep << 6)
+            captures = PAWN_ATTACKS[allyColor][sq] & enemies & allowed
+            while captures:
+                target = captures & -captures
+                captures ^= target
+                targetSq = target.bit_length() - 1
+                self.addPawnMove(sq, targetSq, backRow, moves)
+
+    def getEnpassantMoves(self, pawns, allyColor, enemyColor, occupied, kingSq, pins, moves):
+        enpassantSq = self.enpassantSq
+        if enpassantSq < 0:
+            return
+        capturers = pawns & PAWN_ATTACKS[enemyColor][enpassantSq]
+        capturedBit = 1 << (enpassantSq + (8 if allyColor == 'w' else -8))
+        while capturers:
+            bit = capturers & -capturers
+            capturers ^= bit
+            sq = bit.bit_length() - 1
+            # Lift both pawns and check the king directly: this also covers the rare
+            # case where the two pawns shield the king along a rank.
+            after = (occupied ^ bit ^ capturedBit) | (1 << enpassantSq)
+            self.pieces[enemyColor + 'p'] ^= capturedBit
+            safe = not self.squareUnderAttack(kingSq, enemyColor, after)
+            self.pieces[enemyColor + 'p'] ^= capturedBit
+            if safe and pins.get(sq, FULL) & (1 << enpassantSq):
+                moves.append(sq | enpassantSq << 6 | MOVE_ENPASSANT << 12)
+
+    def addPawnMove(self, start, sq, backRow, moves):
+        code = start | sq << 6
+        if sq >> 3 == backRow:
+            for piece in range(4):  # PROMOTION_PIECES order: Q, R, B, N
+                moves.append(code | (MOVE_PROMOTION | piece) << 12)
+        else:
+            moves.append(code)
+
+    def getCastleMoves(self, kingSq, allyColor, occupied, attacked, moves):
+        """Castling out of a position without check; attacked is the enemy attack set."""
+        rights = self.castlingRights
+        if allyColor == 'w':
+            kingside, queenside = rights & WHITE_KINGSIDE, rights & WHITE_QUEENSIDE
+        else:
+            kingside, queenside = rights & BLACK_KINGSIDE, rights & BLACK_QUEENSIDE
+        if kingside and not occupied & (0b11 << (kingSq + 1)) and not attacked & (0b11 << (kingSq + 1)):
+            moves.append(kingSq | (kingSq + 2) << 6 | MOVE_CASTLE << 12)
+        if queenside and not occupied & (0b111 << (kingSq - 3)) and not attacked & (0b11 << (kingSq - 2)):
+            moves.append(kingSq | (kingSq - 2) << 6 | MOVE_CASTLE << 12)
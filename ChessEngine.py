@@ -1,9 +1,58 @@
 """
 Responsible for starting all the information about state of a chess game.
 """
+import random
+
+# Pieces a pawn can promote to; the queen comes first so it is the default choice
+PROMOTION_PIECES = ('Q', 'R', 'B', 'N')
+
+# A move code packs a move into 16 bits: start square in bits 0-5, end square in bits 6-11
+# (squares are row * 8 + col) and one of these flags in bits 12-15
+MOVE_NORMAL = 0
+MOVE_ENPASSANT = 1
+MOVE_CASTLE = 2
+MOVE_PROMOTION = 4  # ORed with the index of the piece in PROMOTION_PIECES
+
+# Castling rights are a 4 bit mask, one bit per right in FEN order (KQkq)
+WHITE_KINGSIDE = 1
+WHITE_QUEENSIDE = 2
+BLACK_KINGSIDE = 4
+BLACK_QUEENSIDE = 8
+ALL_CASTLING_RIGHTS = 15
+# Rights kept when a move starts or ends on a square: moving a king or rook, or capturing
+# a rook on its home square, clears the matching bits
+CASTLING_SQUARE_MASKS = [ALL_CASTLING_RIGHTS] * 64
+CASTLING_SQUARE_MASKS[0] &= ~BLACK_QUEENSIDE  # a8
+CASTLING_SQUARE_MASKS[4] &= ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)  # e8
+CASTLING_SQUARE_MASKS[7] &= ~BLACK_KINGSIDE  # h8
+CASTLING_SQUARE_MASKS[56] &= ~WHITE_QUEENSIDE  # a1
+CASTLING_SQUARE_MASKS[60] &= ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)  # e1
+CASTLING_SQUARE_MASKS[63] &= ~WHITE_KINGSIDE  # h1
+# FEN letter of each piece. Empty squares become '1' and runs of them are merged into one digit.
+FEN_PIECE_CHARS = {'--': '1', 'wp': 'P', 'wR': 'R', 'wN': 'N', 'wB': 'B', 'wQ': 'Q', 'wK': 'K',
+                   'bp': 'p', 'bR': 'r', 'bN': 'n', 'bB': 'b', 'bQ': 'q', 'bK': 'k'}
+FEN_EMPTY_RUNS = [('1' * n, str(n)) for n in range(8, 1, -1)]
+CASTLING_FEN = [''.join(char for bit, char in zip((1, 2, 4, 8), 'KQkq') if rights & bit) or '-'
+                for rights in range(16)]
+
+# Zobrist keys: one random 64 bit number per piece per square, one for black to move,
+# one per castling right and one per en passant file. A fixed seed keeps keys stable between runs.
+_zobristRandom = random.Random(0x5EED)
+zobristPieces = {piece: [_zobristRandom.getrandbits(64) for _ in range(64)]
+                 for piece in ('wp', 'wR', 'wN', 'wB', 'wQ', 'wK', 'bp', 'bR', 'bN', 'bB', 'bQ', 'bK')}
+zobristBlackToMove = _zobristRandom.getrandbits(64)
+_zobristCastlingRights = [_zobristRandom.getrandbits(64) for _ in range(4)]  # K, Q, k, q
+# Key for each castling mask, the XOR of the keys of its rights. Each right doubles the
+# table: the masks with its bit set are the earlier ones with its key added.
+zobristCastling = [0]
+for _key in _zobristCastlingRights:
+    zobristCastling += [key ^ _key for key in zobristCastling]
+zobristEnpassant = [_zobristRandom.getrandbits(64) for _ in range(8)]
+
+
 class GameState():
 
-    def __init__(self):
+    def __init__(self, backend="mailbox"):
         # Board is an 8x8 2d list, each element of the list has 2 character.
         # The first character represents the color of a piece, 'b' or 'w'
         # The second character repersents the type of the piece, 'K', 'Q', 'R', 'B', 'N','P'.
@@ -23,7 +72,9 @@ class GameState():
                              'B': self.getBishopMoves, 'Q': self.getQueenMoves, 'K': self.getKingMoves}
         
         self.whiteToMove = True
-        self.moveLog = []
+        # One record per move played: (move, castling rights, en passant square, halfmove clock,
+        # zobrist key), the last four as they were before the move, so undoMove restores them directly
+        self.undoStack = []
         # King Track
         self.whiteKingLocation = (7, 4)
         self.blackKingLocation = (0, 4)
@@ -32,42 +83,116 @@ class GameState():
         self.inCheck = False
         self.pins = []
         self.checks = []
+        self.pinDirections = {}
+        self.allowedSquares = None
+        # (zobristKey, legal moves, inCheck, status) of the current position, filled by getValidMoves
+        # and dropped by makeMove/undoMove
+        self.positionCache = None
+        self.piecePlacement = None  # board field of the FEN, same lifetime as positionCache
         # pawn promo idea indicate the pawn go to the back rank when pawn reach row 0 to promo
         # did make it to the back rank ?
         self.pawnPromotion = False
         # self.pawnPromoRow = 0
         # en passant
         self.enpassantPossible = ()
-        self.enpassantPossibleLog = [self.enpassantPossible]
+        # Occupied squares per color and the number of each piece, kept in step by makeMove/undoMove
+        self.pieceSquares = {'w': set(), 'b': set()}
+        self.pieceCounts = {}
+        self.updatePieceLists()
         
         self.boardStates = {}
         self.halfmoveClock = 0
+        self.fullmoveNumber = 1
         
-        self.currentCastlingRights = CastleRights(True, True, True, True)  # Initialize castling rights
-        self.castleRightsLog = [CastleRights(self.currentCastlingRights.wks, self.currentCastlingRights.bks,
-                                             self.currentCastlingRights.wqs, self.currentCastlingRights.bqs)]
-        
-    def getFenForCheckRule(self):
-        rows = []
-        for row in self.board:
-            empty = 0
-            fen_row = ""
-            for square in row:
-                if square == "--":
-                    empty += 1
+        self.castlingRights = ALL_CASTLING_RIGHTS  # mask of WHITE_KINGSIDE, WHITE_QUEENSIDE, ...
+
+        # Zobrist hash of the position, updated incrementally by makeMove/undoMove
+        self.zobristKey = self.computeZobristKey()
+        self.boardStates[self.zobristKey] = 1
+
+        # Move generator: "mailbox" walks self.board, "bitboard" keeps 12 piece bitboards in sync with it
+        if backend == "bitboard":
+            from BitboardEngine import BitboardBackend
+            self.bitboards = BitboardBackend(self)
+        elif backend == "mailbox":
+            self.bitboards = None
+        else:
+            raise ValueError(f"Unknown move generator backend: {backend}")
+
+    @classmethod
+    def fromFen(cls, fen, backend="mailbox"):
+        """
+        Build a GameState directly from a FEN string: board, side to move, castling rights,
+        en passant square, halfmove clock and fullmove number. No moves are replayed, so the
+        repetition history starts at this position.
+        """
+        fields = fen.split()
+        gs = cls(backend=backend)
+        gs.board = []
+        for rank in fields[0].split('/'):
+            row = []
+            for square in rank:
+                if square.isdigit():
+                    row += ["--"] * int(square)
                 else:
-                    if empty > 0:
-                        fen_row += str(empty)
-                        empty = 0
-                    piece = square[1]
-                    fen_row += piece.upper() if square[0] == 'w' else piece.lower()
-            if empty > 0:
-                fen_row += str(empty)
-            rows.append(fen_row)
-
-        board_fen = "/".join(rows)
-        turn = "w" if self.whiteToMove else "b"
-        return board_fen + " " + turn
+                    color = 'w' if square.isupper() else 'b'
+                    row.append(color + ('p' if square in 'Pp' else square.upper()))
+            gs.board.append(row)
+        for r in range(8):
+            for c in range(8):
+                if gs.board[r][c] == 'wK':
+                    gs.whiteKingLocation = (r, c)
+                elif gs.board[r][c] == 'bK':
+                    gs.blackKingLocation = (r, c)
+        gs.whiteToMove = fields[1] == 'w'
+        castling = fields[2] if len(fields) > 2 else '-'
+        gs.castlingRights = sum(1 << bit for bit, char in enumerate('KQkq') if char in castling)
+        if len(fields) > 3 and fields[3] != '-':
+            gs.enpassantPossible = (Move.ranksToRows[fields[3][1]], Move.filesToCols[fields[3][0]])
+        gs.halfmoveClock = int(fields[4]) if len(fields) > 4 else 0
+        gs.fullmoveNumber = int(fields[5]) if len(fields) > 5 else 1
+
+        gs.updatePieceLists()
+        gs.piecePlacement = None
+        gs.zobristKey = gs.computeZobristKey()
+        gs.boardStates = {gs.zobristKey: 1}
+        if gs.bitboards is not None:
+            gs.bitboards = type(gs.bitboards)(gs)
+        return gs
+
+    def updatePieceLists(self):
+        """Rebuild pieceSquares and pieceCounts from the board."""
+        self.pieceSquares = {'w': set(), 'b': set()}
+        self.pieceCounts = dict.fromkeys(zobristPieces, 0)
+        for r, row in enumerate(self.board):
+            for c, square in enumerate(row):
+                if square != "--":
+                    self.pieceSquares[square[0]].add((r, c))
+                    self.pieceCounts[square] += 1
+
+    @property
+    def moveLog(self):
+        """The moves played so far, oldest first, read from the undo stack."""
+        return [record[0] for record in self.undoStack]
+
+    def computeZobristKey(self):
+        """Compute the Zobrist hash of the current position from scratch."""
+        key = 0
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece != "--":
+                    key ^= zobristPieces[piece][r * 8 + c]
+        if not self.whiteToMove:
+            key ^= zobristBlackToMove
+        key ^= zobristCastling[self.castlingRights]
+        if self.enpassantPossible != ():
+            key ^= zobristEnpassant[self.enpassantPossible[1]]
+        return key
+
+    def getFenForCheckRule(self):
+        """Piece placement and side to move: the part of the FEN that identifies a repeated position."""
+        return self.getPiecePlacement() + (" w" if self.whiteToMove else " b")
     
     def isDrawByInsufficientMaterial(self):
         """
@@ -75,77 +200,60 @@ class GameState():
         - King vs King
         - King vs King + Bishop
         - King vs King + Knight
-        - King + Bishop vs King + Bishop on same color
+        - Kings and bishops only, with every bishop on the same square color
+        Answered from the piece counters, without scanning the board.
         """
-        pieces = []
-
-        for row in self.board:
-            for square in row:
-                if square != "--":
-                    pieces.append(square)
-
-        if len(pieces) == 2:
+        total = len(self.pieceSquares['w']) + len(self.pieceSquares['b'])
+        if total == 2:
             return True
-        elif len(pieces) == 3:
-            for piece in pieces:
-                if piece[1] not in ("K", "N", "B"):
-                    return False
-            return True
-        elif len(pieces) == 4:
-            bishops = [p for p in pieces if p[1] == "B"]
-            if len(bishops) == 2:
-                return True
+        counts = self.pieceCounts
+        if total == 3:
+            return counts['wB'] + counts['bB'] + counts['wN'] + counts['bN'] == 1
+        if counts['wB'] + counts['bB'] == total - 2:
+            squareColors = {(r + c) % 2 for color in ('w', 'b') for r, c in self.pieceSquares[color]
+                            if self.board[r][c][1] == 'B'}
+            return len(squareColors) == 1
         return False
         
-    def transformBoard(self):
-        """Transform the board to FEN-compatible format."""
-        transformedBoard = []
-        for row in self.board:
-            transformedRow = []
-            for square in row:
-                if square == '--':
-                    transformedRow.append('--')
-                else:
-                    pieceType = square[1]
-                    if square[0] == 'b':
-                        transformedRow.append(pieceType.lower())
-                    elif square[0] == 'w':
-                        transformedRow.append(pieceType.upper())
-            transformedBoard.append(transformedRow)
-        return transformedBoard
+    def getPiecePlacement(self):
+        """The board field of the FEN, built once per position and cached until the next makeMove/undoMove."""
+        if self.piecePlacement is None:
+            placement = '/'.join([''.join([FEN_PIECE_CHARS[square] for square in row]) for row in self.board])
+            for run, digit in FEN_EMPTY_RUNS:
+                placement = placement.replace(run, digit)
+            self.piecePlacement = placement
+        return self.piecePlacement
 
     def getFen(self):
         """Return the FEN string representing the current board state."""
-        fen = ''
-        transformedBoard = self.transformBoard()
-        for row in transformedBoard:
-            emptyCount = 0
-            for square in row:
-                if square == '--':
-                    emptyCount += 1
-                else:
-                    if emptyCount > 0:
-                        fen += str(emptyCount)
-                        emptyCount = 0
-                    fen += square
-            if emptyCount > 0:
-                fen += str(emptyCount)
-            fen += '/'
-        fen = fen.strip('/')
-        fen += ' ' + ('w' if self.whiteToMove else 'b')
-        castlingRights = ''
-        if self.currentCastlingRights.wks: castlingRights += 'K'
-        if self.currentCastlingRights.wqs: castlingRights += 'Q'
-        if self.currentCastlingRights.bks: castlingRights += 'k'
-        if self.currentCastlingRights.bqs: castlingRights += 'q'
-        if castlingRights == '': castlingRights = '-'
-        fen += ' ' + castlingRights
-        if self.enpassantPossible == ():
-            fen += ' -'
-        else:
-            fen += ' ' + self.getChessNotation(self.enpassantPossible)
-        fen += ' 0 1'
-        return fen
+        return ' '.join((self.getPiecePlacement(),
+                         'w' if self.whiteToMove else 'b',
+                         CASTLING_FEN[self.castlingRights],
+                         self.getChessNotation(self.enpassantPossible) if self.enpassantPossible != () else '-',
+                         str(self.halfmoveClock),
+                         str(self.fullmoveNumber)))
+
+    def perft(self, depth):
+        """Count the leaf nodes of the legal move tree below this position, to the given depth."""
+        if depth == 0:
+            return 1
+        if depth == 1:
+            return self.countValidMoves()
+        nodes = 0
+        for move in self.getValidMoves():
+            self.makeMove(move)
+            nodes += self.perft(depth - 1)
+            self.undoMove()
+        return nodes
+
+    def divide(self, depth):
+        """Perft split by root move: a dict of UCI move -> leaf nodes below it."""
+        counts = {}
+        for move in self.getValidMoves():
+            self.makeMove(move)
+            counts[move.getUci()] = self.perft(depth - 1)
+            self.undoMove()
+        return counts
 
     # Helper function to convert coordinates like (x, y) to chess notation ('a1', 'b3', etc.)
     def getChessNotation(self, coords):
@@ -159,9 +267,21 @@ class GameState():
     '''
 
     def makeMove(self, move):
+        self.positionCache = None
+        self.piecePlacement = None
+        self.undoStack.append((move, self.castlingRights, self.enpassantPossible, self.halfmoveClock,
+                               self.zobristKey))
+        key = self.zobristKey ^ zobristBlackToMove ^ zobristCastling[self.castlingRights]
+        if self.enpassantPossible != ():
+            key ^= zobristEnpassant[self.enpassantPossible[1]]
+        key ^= zobristPieces[move.pieceMoved][move.startRow * 8 + move.startCol]
+        if move.isEnpassantMove:
+            key ^= zobristPieces[move.pieceCaptured][move.startRow * 8 + move.endCol]
+        elif move.pieceCaptured != "--":
+            key ^= zobristPieces[move.pieceCaptured][move.endRow * 8 + move.endCol]
+
         self.board[move.startRow][move.startCol] = "--"
         self.board[move.endRow][move.endCol] = move.pieceMoved
-        self.moveLog.append(move)
         self.whiteToMove = not self.whiteToMove  # swap player
         # update the king's location
         if move.pieceMoved == 'wK':
@@ -170,19 +290,25 @@ class GameState():
             self.blackKingLocation = (move.endRow, move.endCol)
         # pawn promo
         if move.pawnPromotion:
-            promotionPiece = 'Q'
-            self.board[move.endRow][move.endCol] = move.pieceMoved[0] + promotionPiece
+            self.board[move.endRow][move.endCol] = move.pieceMoved[0] + move.promotionPiece
+            self.pieceCounts[move.pieceMoved] -= 1
+            self.pieceCounts[move.pieceMoved[0] + move.promotionPiece] += 1
         # enpassant
         if move.isEnpassantMove:
             self.board[move.startRow][move.endCol] = '--'  # capturing
-        self.enpassantPossibleLog.append(self.enpassantPossible)
+        allySquares = self.pieceSquares[move.pieceMoved[0]]
+        allySquares.remove((move.startRow, move.startCol))
+        allySquares.add((move.endRow, move.endCol))
+        if move.isCapture:
+            capturedRow = move.startRow if move.isEnpassantMove else move.endRow
+            self.pieceSquares[move.pieceCaptured[0]].remove((capturedRow, move.endCol))
+            self.pieceCounts[move.pieceCaptured] -= 1
         if move.pieceMoved[1] == 'p' and abs(move.startRow - move.endRow) == 2:  # only 2 square pawn advance
             self.enpassantPossible = ((move.startRow + move.endRow) // 2, move.startCol)
         else:
-            self.enpassantPossible = () 
-        self.updateCastleRights(move)
-        self.castleRightsLog.append(CastleRights(self.currentCastlingRights.wks, self.currentCastlingRights.bks,
-                                                 self.currentCastlingRights.wqs, self.currentCastlingRights.bqs))
+            self.enpassantPossible = ()
+        self.castlingRights &= CASTLING_SQUARE_MASKS[move.startRow * 8 + move.startCol] & \
+            CASTLING_SQUARE_MASKS[move.endRow * 8 + move.endCol]
         if move.isCastleMove:
             if move.endCol - move.startCol == 2: #kingside castle move
                 self.board[move.endRow][move.endCol-1] = self.board[move.endRow][move.endCol+1] #moves the rook
@@ -190,117 +316,155 @@ class GameState():
             else: #queenside castle move
                 self.board[move.endRow][move.endCol+1] = self.board[move.endRow][move.endCol-2] #moves the rook
                 self.board[move.endRow][move.endCol-2] = '--' #erase old rook
-                
-        if move.pieceMoved[1] == "P" or move.pieceCaptured != "--":
+            rook = move.pieceMoved[0] + 'R'
+            rookStartCol, rookEndCol = (7, 5) if move.endCol - move.startCol == 2 else (0, 3)
+            key ^= zobristPieces[rook][move.endRow * 8 + rookStartCol] ^ zobristPieces[rook][move.endRow * 8 + rookEndCol]
+            allySquares.remove((move.endRow, rookStartCol))
+            allySquares.add((move.endRow, rookEndCol))
+
+        key ^= zobristPieces[self.board[move.endRow][move.endCol]][move.endRow * 8 + move.endCol]
+        key ^= zobristCastling[self.castlingRights]
+        if self.enpassantPossible != ():
+            key ^= zobristEnpassant[self.enpassantPossible[1]]
+        self.zobristKey = key
+
+        if move.pieceMoved[1] == "p" or move.pieceCaptured != "--":
             self.halfmoveClock = 0
         else:
             self.halfmoveClock += 1
+        if self.whiteToMove:  # black just moved
+            self.fullmoveNumber += 1
 
-        fen = self.getFen()
-        if fen in self.boardStates:
-            self.boardStates[fen] += 1
-        else:
-            self.boardStates[fen] = 1
-            
-        self.moveLog.append(move)
+        self.boardStates[key] = self.boardStates.get(key, 0) + 1
+        if self.bitboards is not None:
+            self.bitboards.updateSquares(move)
         
     '''
     undo
     '''
 
     def undoMove(self):
-        if len(self.moveLog) == 0:
+        if not self.undoStack:
             print("No moves to undo!")
             return  # No move to undo
-        
-        if self.checkmate or self.stalemate:
-            print("Cannot undo after checkmate or stalemate!")
-            return  # Prevent undo after game over states
-        
-        if len(self.moveLog) != 0:  # make sure that there is a move to undo
-            move = self.moveLog.pop()
-            self.board[move.startRow][move.startCol] = move.pieceMoved
-            self.board[move.endRow][move.endCol] = move.pieceCaptured
-            self.whiteToMove = not self.whiteToMove  # swap players
-            # update the king's location
-            if move.pieceMoved == 'wK':
-                self.whiteKingLocation = (move.startRow, move.startCol)
-            elif move.pieceMoved == 'bK':
-                self.blackKingLocation = (move.startRow, move.startCol)
-            # undo enpassant
-            if move.isEnpassantMove:
-                self.board[move.endRow][move.endCol] = '--'
-                self.board[move.startRow][move.endCol] = 'bp' if self.whiteToMove else 'wp'
-                self.enpassantPossibleLog.append(self.enpassantPossible)
-                
-            self.enpassantPossibleLog.pop()
-            self.enpassantPossible = self.enpassantPossibleLog[-1]
-                
-            # Undo castling rights
-            self.castleRightsLog.pop()
-            self.currentCastlingRights = CastleRights(self.castleRightsLog[-1].wks, self.castleRightsLog[-1].bks,
-                                                      self.castleRightsLog[-1].wqs, self.castleRightsLog[-1].bqs)
-
-            # Undo a 2 square pawn advance
-            if move.pieceMoved[1] == 'p' and abs(move.startRow - move.endRow) == 2:
-                self.enpassantPossible = ()
-            # Undo pawn promotion
-            if move.pawnPromotion:
-                self.board[move.startRow][move.startCol] = 'wp' if move.pieceMoved[0] == 'w' else 'bp'
-                if move.pieceCaptured != '--':
-                    self.board[move.endRow][move.endCol] = move.pieceCaptured
-                else:
-                    self.board[move.endRow][move.endCol] = '--'
-                
-            # Undo castling move
-            if move.isCastleMove:
-                if move.endCol - move.startCol == 2:
-                    self.board[move.endRow][move.endCol + 1] = self.board[move.endRow][move.endCol - 1]
-                    self.board[move.endRow][move.endCol - 1] = '--'
-                else:
-                    self.board[move.endRow][move.endCol - 2] = self.board[move.endRow][move.endCol + 1]
-                    self.board[move.endRow][move.endCol + 1] = '--'
-    
-        self.checkmate = False;
-        self.stalemate = False;
-    
-    def updateCastleRights(self, move):
+
+        move, self.castlingRights, self.enpassantPossible, self.halfmoveClock, key = self.undoStack.pop()
+        self.positionCache = None
+        self.piecePlacement = None
+        self.boardStates[self.zobristKey] -= 1
+        if self.boardStates[self.zobristKey] == 0:
+            del self.boardStates[self.zobristKey]
+        self.zobristKey = key
+        self.board[move.startRow][move.startCol] = move.pieceMoved
+        self.board[move.endRow][move.endCol] = move.pieceCaptured
+        self.whiteToMove = not self.whiteToMove  # swap players
+        if not self.whiteToMove:
+            self.fullmoveNumber -= 1
+        # update the king's location
         if move.pieceMoved == 'wK':
-            self.currentCastlingRights.wks = False
-            self.currentCastlingRights.wqs = False
+            self.whiteKingLocation = (move.startRow, move.startCol)
         elif move.pieceMoved == 'bK':
-            self.currentCastlingRights.bks = False
-            self.currentCastlingRights.bqs = False
-        elif move.pieceMoved == 'wR':
-            if move.startRow == 7:
-                if move.startCol == 0:  # left rook
-                    self.currentCastlingRights.wqs = False
-                elif move.startCol == 7:  # right rook
-                    self.currentCastlingRights.wks = False
-        elif move.pieceMoved == 'bR':
-            if move.startRow == 0:
-                if move.startCol == 0:  # left rook
-                    self.currentCastlingRights.bqs = False
-                elif move.startCol == 7:  # right rook
-                    self.currentCastlingRights.bks = False
-        if move.pieceCaptured == 'wR':
-            if move.endRow == 7:
-                if move.endCol == 0:
-                    self.currentCastlingRights.wqs = False
-                elif move.endCol == 7:
-                    self.currentCastlingRights.wks = False
-        elif move.pieceCaptured == 'bR':
-            if move.endRow == 0:
-                if move.endCol == 0:
-                    self.currentCastlingRights.bqs = False
-                elif move.endCol == 7:
-                    self.currentCastlingRights.bks = False
+            self.blackKingLocation = (move.startRow, move.startCol)
+        # undo enpassant
+        if move.isEnpassantMove:
+            self.board[move.endRow][move.endCol] = '--'
+            self.board[move.startRow][move.endCol] = move.pieceCaptured
+        allySquares = self.pieceSquares[move.pieceMoved[0]]
+        allySquares.remove((move.endRow, move.endCol))
+        allySquares.add((move.startRow, move.startCol))
+        if move.isCapture:
+            capturedRow = move.startRow if move.isEnpassantMove else move.endRow
+            self.pieceSquares[move.pieceCaptured[0]].add((capturedRow, move.endCol))
+            self.pieceCounts[move.pieceCaptured] += 1
+        if move.pawnPromotion:
+            self.pieceCounts[move.pieceMoved] += 1
+            self.pieceCounts[move.pieceMoved[0] + move.promotionPiece] -= 1
+        # Undo castling move
+        if move.isCastleMove:
+            if move.endCol - move.startCol == 2:
+                self.board[move.endRow][move.endCol + 1] = self.board[move.endRow][move.endCol - 1]
+                self.board[move.endRow][move.endCol - 1] = '--'
+                allySquares.remove((move.endRow, 5))
+                allySquares.add((move.endRow, 7))
+            else:
+                self.board[move.endRow][move.endCol - 2] = self.board[move.endRow][move.endCol + 1]
+                self.board[move.endRow][move.endCol + 1] = '--'
+                allySquares.remove((move.endRow, 3))
+                allySquares.add((move.endRow, 0))
 
+        if self.bitboards is not None:
+            self.bitboards.updateSquares(move)
+        self.checkmate = False
+        self.stalemate = False
+    
     '''
     All move considering checks
     '''
 
     def getValidMoves(self):
+        """
+        The legal moves of the position. Also sets inCheck and the checkmate/stalemate flags
+        (stalemate covers every draw). The result is cached until the next makeMove/undoMove,
+        so asking again for the same position costs a list copy.
+        """
+        cache = self.positionCache
+        if cache is None or cache[0] != self.zobristKey:
+            if self.bitboards is not None:
+                moves = self.bitboards.getValidMoves()
+                self.inCheck = self.bitboards.inCheck
+            else:
+                moves = self.getMailboxMoves()
+
+            if len(moves) == 0:
+                status = 'checkmate' if self.inCheck else 'stalemate'
+            elif self.isDrawByInsufficientMaterial():
+                status = 'insufficient material'
+            elif self.halfmoveClock >= 100:
+                status = 'fifty-move rule'
+            elif self.boardStates.get(self.zobristKey, 0) >= 3:
+                status = 'threefold repetition'
+            else:
+                status = None
+            cache = self.positionCache = (self.zobristKey, moves, self.inCheck, status)
+
+        _, moves, self.inCheck, status = cache
+        self.checkmate = status == 'checkmate'
+        self.stalemate = status is not None and not self.checkmate
+        return list(moves)
+
+    def getStatus(self):
+        """
+        How the game has ended in this position: 'checkmate', 'stalemate', 'insufficient material',
+        'fifty-move rule' or 'threefold repetition', or None while it goes on.
+        """
+        if self.positionCache is None or self.positionCache[0] != self.zobristKey:
+            self.getValidMoves()
+        return self.positionCache[3]
+
+    def isCheckmate(self):
+        return self.getStatus() == 'checkmate'
+
+    def isStalemate(self):
+        return self.getStatus() == 'stalemate'
+
+    def isDraw(self):
+        """Stalemate, insufficient material, the fifty-move rule or threefold repetition."""
+        status = self.getStatus()
+        return status is not None and status != 'checkmate'
+
+    def countValidMoves(self):
+        """
+        The number of legal moves, for perft leaves. The bitboard backend counts them from its
+        target sets without building a move list. Unlike getValidMoves this does not update
+        the checkmate/stalemate flags.
+        """
+        if self.bitboards is not None:
+            count = self.bitboards.countMoves()
+            self.inCheck = self.bitboards.inCheck
+            return count
+        return len(self.getMailboxMoves())
+
+    def getMailboxMoves(self):
         moves = []
         self.inCheck, self.pins, self.checks = self.checkForPinsAndChecks()
         if self.whiteToMove:
@@ -310,57 +474,32 @@ class GameState():
             kingRow = self.blackKingLocation[0]
             kingCol = self.blackKingLocation[1]
         
+        # Pinned square -> pin direction, read by the generators instead of searching self.pins
+        self.pinDirections = {(pin[0], pin[1]): (pin[2], pin[3]) for pin in self.pins}
+        # Squares a non-king move must land on: None when not in check, otherwise the checking
+        # piece plus the squares between it and the king. The generators never emit other moves.
+        # En passant captures are exempt, since isEnpassantLegal already plays them out.
+        self.allowedSquares = None
         if self.inCheck:
-            if len(self.checks) == 1:
-                moves = self.getAllPossibleMoves()
-                check = self.checks[0]
-                checkRow = check[0]
-                checkCol = check[1]
-                pieceChecking = self.board[checkRow][checkCol]
-                validSquares = []
-
-                if pieceChecking[1] == 'N':
-                    validSquares = [(checkRow, checkCol)]
-                else:
-                    for i in range(1, 8):
-                        validSquare = (kingRow + check[2] * i , kingCol + check[3] * i)
-                        validSquares.append(validSquare)
-                        if validSquare[0] == checkRow and validSquare[1] == checkCol:
-                            break
-                for i in range(len(moves) - 1, -1, -1):
-                    if moves[i].pieceMoved[1] != 'K':
-                        if not (moves[i].endRow, moves[i].endCol) in validSquares:
-                            moves.remove(moves[i])
-            else:
+            if len(self.checks) > 1:  # double check, only the king can move
                 self.getKingMoves(kingRow, kingCol, moves)
-        else:
-            moves = self.getAllPossibleMoves()
-        
-        if len(moves) == 0:
-            if self.inCheck:
-                self.checkmate = True
+                return moves
+            checkRow, checkCol, dRow, dCol = self.checks[0]
+            if self.board[checkRow][checkCol][1] == 'N':
+                self.allowedSquares = {(checkRow, checkCol)}
             else:
-                self.stalemate = True
-        elif self.isDrawByInsufficientMaterial():
-            self.stalemate = True
-        elif self.halfmoveClock >= 100:
-            self.stalemate = True
-        elif self.boardStates.get(self.getFen(), 0) >= 3:
-            self.stalemate = True
-        else:
-            self.checkmate = False
-            self.stalemate = False
-
-        return moves
+                self.allowedSquares = set()
+                for i in range(1, 8):
+                    square = (kingRow + dRow * i, kingCol + dCol * i)
+                    self.allowedSquares.add(square)
+                    if square == (checkRow, checkCol):
+                        break
+        return self.getAllPossibleMoves()
 
     def getAllPossibleMoves(self):
         moves = []
-        for r in range(len(self.board)):
-            for c in range(len(self.board[r])):
-                turn = self.board[r][c][0]
-                if (turn == 'w' and self.whiteToMove) or (turn == 'b' and not self.whiteToMove):
-                    piece = self.board[r][c][1]
-                    self.moveFunctions[piece](r, c, moves) 
+        for r, c in self.pieceSquares['w' if self.whiteToMove else 'b']:  # only the side to move's pieces
+            self.moveFunctions[self.board[r][c][1]](r, c, moves)
         return moves
     
     '''
@@ -368,14 +507,9 @@ class GameState():
     '''
 
     def getPawnMoves(self, r, c, moves):
-        piecePinned = False
-        pinDirection = ()
-        for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == r and self.pins[i][1] == c:
-                piecePinned = True
-                pinDirection = (self.pins[i][2], self.pins[i][3])
-                self.pins.remove(self.pins[i])
-                break
+        pinDirection = self.pinDirections.get((r, c))
+        piecePinned = pinDirection is not None
+        allowed = self.allowedSquares
 
         if self.whiteToMove:
             moveAmount = -1
@@ -387,54 +521,67 @@ class GameState():
             startRow = 1
             backRow = 7
             enemyColor = 'w'
-        pawnPromotion = False
-
+        # a pinned pawn may still move along the pin line, towards or away from its king
         if self.board[r + moveAmount][c] == "--":  # 1 square pawn advance
-            if not piecePinned or pinDirection == (moveAmount, 0):
-                if r + moveAmount == backRow:  # get to back rank
-                    pawnPromotion = True
-                else:
-                    pawnPromotion = False
-                moves.append(Move((r, c), (r + moveAmount, c), self.board, pawnPromotion=pawnPromotion))  # 2 square pawn advance
-                if  r == startRow and self.board[r + 2 * moveAmount][c] == "--":
+            if not piecePinned or pinDirection in ((moveAmount, 0), (-moveAmount, 0)):
+                if allowed is None or (r + moveAmount, c) in allowed:
+                    self.addPawnMove((r, c), (r + moveAmount, c), backRow, moves)
+                if r == startRow and self.board[r + 2 * moveAmount][c] == "--" and \
+                        (allowed is None or (r + 2 * moveAmount, c) in allowed):  # 2 square pawn advance
                     moves.append(Move((r, c), (r + 2 * moveAmount, c), self.board))
         if c - 1 >= 0:  # captures to the left
-            if not piecePinned or pinDirection == (moveAmount, -1):
-                if self.board[r + moveAmount][c - 1][0] == enemyColor:
-                    if r + moveAmount == backRow:
-                        pawnPromotion = True
-                    else:
-                        pawnPromotion = False
-                    moves.append(Move((r, c), (r + moveAmount, c - 1), self.board, pawnPromotion=pawnPromotion))
-                if (r + moveAmount, c - 1) == self.enpassantPossible:
+            if not piecePinned or pinDirection in ((moveAmount, -1), (-moveAmount, 1)):
+                if self.board[r + moveAmount][c - 1][0] == enemyColor and \
+                        (allowed is None or (r + moveAmount, c - 1) in allowed):
+                    self.addPawnMove((r, c), (r + moveAmount, c - 1), backRow, moves)
+                if (r + moveAmount, c - 1) == self.enpassantPossible and self.isEnpassantLegal(r, c, c - 1):
                         moves.append(Move((r, c), (r + moveAmount, c - 1), self.board, isEnpassantMove=True))
         if c + 1 <= 7:  # captures to the right
-            if not piecePinned or pinDirection == (moveAmount, 1):
-                if self.board[r + moveAmount][c + 1][0] == enemyColor:
-                    if r + moveAmount == backRow:
-                        pawnPromotion = True
-                    else:
-                        pawnPromotion = False
-                    moves.append(Move((r, c), (r + moveAmount, c + 1), self.board, pawnPromotion=pawnPromotion))
-                if (r + moveAmount, c + 1) == self.enpassantPossible:
+            if not piecePinned or pinDirection in ((moveAmount, 1), (-moveAmount, -1)):
+                if self.board[r + moveAmount][c + 1][0] == enemyColor and \
+                        (allowed is None or (r + moveAmount, c + 1) in allowed):
+                    self.addPawnMove((r, c), (r + moveAmount, c + 1), backRow, moves)
+                if (r + moveAmount, c + 1) == self.enpassantPossible and self.isEnpassantLegal(r, c, c + 1):
                         moves.append(Move((r, c), (r + moveAmount, c + 1), self.board, isEnpassantMove=True))
-        
+
+    def addPawnMove(self, startSq, endSq, backRow, moves):
+        if endSq[0] == backRow:  # get to back rank, one move per promotion piece
+            for promotionPiece in PROMOTION_PIECES:
+                moves.append(Move(startSq, endSq, self.board, pawnPromotion=True, promotionPiece=promotionPiece))
+        else:
+            moves.append(Move(startSq, endSq, self.board))
+
+    def isEnpassantLegal(self, r, c, endCol):
+        """
+        Play an en passant capture on the board and check that it doesn't leave our king attacked.
+        Both pawns leave the same rank at once, which the pin scan can't see, and the captured
+        pawn may be the piece giving check.
+        """
+        pawn = self.board[r][c]
+        captured = self.board[r][endCol]
+        endRow = self.enpassantPossible[0]
+        self.board[r][c] = "--"
+        self.board[r][endCol] = "--"
+        self.board[endRow][endCol] = pawn
+        kingRow, kingCol = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+        legal = not self.squareUnderAttack(kingRow, kingCol, pawn[0])
+        self.board[r][c] = pawn
+        self.board[r][endCol] = captured
+        self.board[endRow][endCol] = "--"
+        return legal
+
     '''
     Get all the rook moves
     '''
 
     def getRookMoves(self, r, c, moves):
-        piecePinned = False
-        pinDirection = ()
-        for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == r and self.pins[i][1] == c:
-                piecePinned = True
-                pinDirection = (self.pins[i][2], self.pins[i][3])
-                if self.board[r][c][1] != 'Q':
-                    self.pins.remove(self.pins[i])
-                break
-
-        directions = ((-1, 0), (0, -1), (1, 0), (0, 1))
+        self.getSlidingMoves(r, c, ((-1, 0), (0, -1), (1, 0), (0, 1)), moves)
+
+    def getSlidingMoves(self, r, c, directions, moves):
+        """Moves along each direction up to the first piece; a pinned piece keeps to its pin line."""
+        pinDirection = self.pinDirections.get((r, c))
+        piecePinned = pinDirection is not None
+        allowed = self.allowedSquares
         enemyColor = "b" if self.whiteToMove else "w"
         for d in directions:
             for i in range(1, 8):
@@ -444,12 +591,16 @@ class GameState():
                     if not piecePinned or pinDirection == d or pinDirection == (-d[0], -d[1]):
                         endPiece = self.board[endRow][endCol]
                         if endPiece == "--":
-                            moves.append(Move((r, c), (endRow, endCol), self.board))
+                            if allowed is None or (endRow, endCol) in allowed:
+                                moves.append(Move((r, c), (endRow, endCol), self.board))
                         elif endPiece[0] == enemyColor:
-                            moves.append(Move((r, c), (endRow, endCol), self.board))
+                            if allowed is None or (endRow, endCol) in allowed:
+                                moves.append(Move((r, c), (endRow, endCol), self.board))
                             break
                         else:
                             break
+                    else:  # pinned off this line
+                        break
                 else:  # off board
                     break
 
@@ -458,64 +609,31 @@ class GameState():
     '''
 
     def getKnightMoves(self, r, c, moves):
-        piecePinned = False
-        for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == r and self.pins[i][1] == c:
-                piecePinned = True
-                self.pins.remove(self.pins[i])
-                break
-
+        if (r, c) in self.pinDirections:  # a pinned knight can never move
+            return
+        allowed = self.allowedSquares
         knightMoves = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
         allyColor = "w" if self.whiteToMove else "b"
         for m in knightMoves:
             endRow = r + m[0]
             endCol = c + m[1]
-            if 0 <= endRow < 8 and 0 <= endCol < 8:
-                if not piecePinned:
-                    endPiece = self.board[endRow][endCol]
-                    if endPiece[0] != allyColor:
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
+            if 0 <= endRow < 8 and 0 <= endCol < 8 and self.board[endRow][endCol][0] != allyColor:
+                if allowed is None or (endRow, endCol) in allowed:
+                    moves.append(Move((r, c), (endRow, endCol), self.board))
 
     '''
     Get all the bishop moves
     '''
 
     def getBishopMoves(self, r, c, moves):
-        piecePinned = False
-        pinDirection = ()
-        for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == r and self.pins[i][1] == c:
-                piecePinned = True
-                pinDirection = (self.pins[i][2], self.pins[i][3])
-                self.pins.remove(self.pins[i])
-                break
-
-        directions = ((-1, -1), (-1, 1), (1, -1), (1, 1))
-        enemyColor = "b" if self.whiteToMove else "w"
-        for d in directions:
-            for i in range(1, 8):
-                endRow = r + d[0] * i
-                endCol = c + d[1] * i
-                if 0 <= endRow < 8 and 0 <= endCol < 8:
-                    if not piecePinned or pinDirection == d or pinDirection == (-d[0], -d[1]):
-                        endPiece = self.board[endRow][endCol]
-                        if endPiece == "--":
-                            moves.append(Move((r, c), (endRow, endCol), self.board))
-                        elif endPiece[0] == enemyColor:
-                            moves.append(Move((r, c), (endRow, endCol), self.board))
-                            break
-                        else:
-                            break
-                else:
-                    break
+        self.getSlidingMoves(r, c, ((-1, -1), (-1, 1), (1, -1), (1, 1)), moves)
 
     '''
     Get all the queen moves
     '''
 
     def getQueenMoves(self, r, c, moves):
-        self.getRookMoves(r, c, moves)
-        self.getBishopMoves(r, c, moves)
+        self.getSlidingMoves(r, c, ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1)), moves)
                 
     '''
     Get all King moves
@@ -525,44 +643,42 @@ class GameState():
         rowMoves = (-1, -1, -1, 0, 0, 1, 1, 1)
         colMoves = (-1, 0, 1, -1, 1, -1, 0, 1)
         allyColor = "w" if self.whiteToMove else "b"
+        # Lift the king off the board while testing its destinations, so a slider
+        # checking along a line can't be "blocked" by the king that is stepping away from it
+        king = self.board[r][c]
+        self.board[r][c] = "--"
+        attackedSquares = {}
         for i in range(8):
             endRow = r + rowMoves[i]
             endCol = c + colMoves[i]
             if 0 <= endRow < 8 and 0 <= endCol < 8:
                 endPiece = self.board[endRow][endCol]
                 if endPiece == "--" or endPiece[0] != allyColor:
-                    # Simulate the move to check for checks
-                    tempBoard = [row[:] for row in self.board]  # Create a copy
-                    tempBoard[r][c] = "--"
-                    tempBoard[endRow][endCol] = self.board[r][c]
-                    tempGameState = GameState()
-                    tempGameState.board = tempBoard
-                    if allyColor == 'w':
-                        tempGameState.whiteKingLocation = (endRow, endCol)
-                    else:
-                        tempGameState.blackKingLocation = (endRow, endCol)
-                    tempGameState.whiteToMove = self.whiteToMove
-                    if not tempGameState.squareUnderAttack(endRow, endCol, allyColor):
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
-        self.getCastleMoves(r, c, moves, allyColor)
-    
-    def getCastleMoves(self, r, c, moves, allyColor):
-        self.inCheck = self.squareUnderAttack(r, c, allyColor)
+                    attackedSquares[(endRow, endCol)] = self.squareUnderAttack(endRow, endCol, allyColor)
+        self.board[r][c] = king
+        for square, attacked in attackedSquares.items():
+            if not attacked:
+                moves.append(Move((r, c), square, self.board))
+        self.getCastleMoves(r, c, moves, allyColor, attackedSquares)
+
+    def getCastleMoves(self, r, c, moves, allyColor, attackedSquares):
+        # inCheck comes from checkForPinsAndChecks and the squares next to the king were
+        # already tested by getKingMoves, so only the squares two files away need a new test
         if self.inCheck:
             return
-        if (self.whiteToMove and self.currentCastlingRights.wks) or (not self.whiteToMove and self.currentCastlingRights.bks):
-            self.getKingsideCastleMoves(r, c, moves, allyColor)
-        if (self.whiteToMove and self.currentCastlingRights.wqs) or (not self.whiteToMove and self.currentCastlingRights.bqs):
-            self.getQueensideCastleMoves(r, c, moves, allyColor)
-
-    def getKingsideCastleMoves(self, r, c, moves, allyColor):
-            if self.board[r][c + 1] == '--' and self.board[r][c + 2] == '--' and \
-            not self.squareUnderAttack(r, c + 1, allyColor) and not self.squareUnderAttack(r, c + 2, allyColor):
+        if self.castlingRights & (WHITE_KINGSIDE if self.whiteToMove else BLACK_KINGSIDE):
+            self.getKingsideCastleMoves(r, c, moves, allyColor, attackedSquares)
+        if self.castlingRights & (WHITE_QUEENSIDE if self.whiteToMove else BLACK_QUEENSIDE):
+            self.getQueensideCastleMoves(r, c, moves, allyColor, attackedSquares)
+
+    def getKingsideCastleMoves(self, r, c, moves, allyColor, attackedSquares):
+        if self.board[r][c + 1] == '--' and self.board[r][c + 2] == '--' and \
+            not attackedSquares[(r, c + 1)] and not self.squareUnderAttack(r, c + 2, allyColor):
                 moves.append(Move((r, c), (r, c + 2), self.board, isCastleMove=True))
 
-    def getQueensideCastleMoves(self, r, c, moves, allyColor):
+    def getQueensideCastleMoves(self, r, c, moves, allyColor, attackedSquares):
         if self.board[r][c - 1] == '--' and self.board[r][c - 2] == '--' and self.board[r][c - 3] == '--' and \
-            not self.squareUnderAttack(r, c - 1, allyColor) and not self.squareUnderAttack(r, c - 2, allyColor):
+            not attackedSquares[(r, c - 1)] and not self.squareUnderAttack(r, c - 2, allyColor):
                 moves.append(Move((r, c), (r, c - 2), self.board, isCastleMove=True))
 
     def squareUnderAttack(self, r, c, allyColor):
@@ -649,22 +765,16 @@ class GameState():
         return inCheck, pins, checks
 
 
-class CastleRights():
-
-    def __init__(self, wks, bks, wqs, bqs):
-        self.wks = wks
-        self.bks = bks
-        self.wqs = wqs
-        self.bqs = bqs
-
-
 class Move():
+    __slots__ = ('startRow', 'startCol', 'endRow', 'endCol', 'pieceMoved', 'pieceCaptured', 'pawnPromotion',
+                 'promotionPiece', 'isEnpassantMove', 'isCapture', 'isCastleMove', 'moveID')
     ranksToRows = {"1":7, "2":6, "3":5, "4":4, "5":3, "6":2, "7":1, "8":0}
     rowsToRanks = {v:k for k, v in ranksToRows.items()}
     filesToCols = {"a":0, "b":1, "c":2, "d":3, "e":4, "f":5, "g":6, "h":7}
     colsToFiles = {v:k for k, v in filesToCols.items()}
     
-    def __init__(self, startSq , endSq, board, pawnPromotion=False, isEnpassantMove=False, isCastleMove=False, inCheck_instance=None):
+    def __init__(self, startSq , endSq, board, pawnPromotion=False, isEnpassantMove=False, isCastleMove=False,
+                 promotionPiece='Q'):
         self.startRow = startSq[0]
         self.startCol = startSq[1]
         self.endRow = endSq[0]
@@ -672,24 +782,61 @@ class Move():
         self.pieceMoved = board[self.startRow][self.startCol]
         self.pieceCaptured = board[self.endRow][self.endCol]
         self.pawnPromotion = pawnPromotion
+        self.promotionPiece = promotionPiece
         self.isEnpassantMove = isEnpassantMove
         if self.isEnpassantMove:
             self.pieceCaptured = 'wp' if self.pieceMoved == 'bp' else 'bp'
         self.isCapture = self.pieceCaptured != '--'
         self.isCastleMove = isCastleMove
         self.moveID = self.startRow * 1000 + self.startCol * 100 + self.endRow * 10 + self.endCol
-        self.inCheck_instance = inCheck_instance
+        if pawnPromotion:
+            # a queen promotion keeps the plain ID, so a clicked move matches it
+            self.moveID += PROMOTION_PIECES.index(promotionPiece) * 10000
         
     def __eq__(self, other):
         if isinstance(other, Move):
             return self.moveID == other.moveID
         return False
+
+    def __hash__(self):
+        return self.moveID
+
+    @property
+    def code(self):
+        """The move packed into a 16 bit int: start square, end square and a MOVE_* flag."""
+        if self.pawnPromotion:
+            flags = MOVE_PROMOTION | PROMOTION_PIECES.index(self.promotionPiece)
+        elif self.isEnpassantMove:
+            flags = MOVE_ENPASSANT
+        elif self.isCastleMove:
+            flags = MOVE_CASTLE
+        else:
+            flags = MOVE_NORMAL
+        return self.startRow << 3 | self.startCol | (self.endRow << 3 | self.endCol) << 6 | flags << 12
+
+    @staticmethod
+    def fromCode(code, board):
+        """Create a Move object from a move code on the given board."""
+        start = code & 63
+        end = code >> 6 & 63
+        flags = code >> 12
+        if flags & MOVE_PROMOTION:
+            return Move((start >> 3, start & 7), (end >> 3, end & 7), board, pawnPromotion=True,
+                        promotionPiece=PROMOTION_PIECES[flags & 3])
+        return Move((start >> 3, start & 7), (end >> 3, end & 7), board,
+                    isEnpassantMove=flags == MOVE_ENPASSANT, isCastleMove=flags == MOVE_CASTLE)
     
     def getRanksFiles(self, r, c):
         return self.colsToFiles[c] + self.rowsToRanks[r]
     
     def getChessNotation(self):
         return self.getRanksFiles(self.startRow, self.startCol) + self.getRanksFiles(self.endRow, self.endCol)
+
+    def getUci(self):
+        """Return the move in UCI format, including the promotion piece (e.g. 'e7e8q')."""
+        if self.pawnPromotion:
+            return self.getChessNotation() + self.promotionPiece.lower()
+        return self.getChessNotation()
         
     def __str__(self):
         if self.isCastleMove:
@@ -697,7 +844,7 @@ class Move():
         
         endSquare = self.getRanksFiles(self.endRow, self.endCol)
         if self.pawnPromotion:
-            return endSquare + "=" + self.pieceMoved[0].upper()
+            return endSquare + "=" + self.promotionPiece
         if self.pieceMoved[1] == 'p':
             if self.isCapture:
                 return self.colsToFiles[self.startCol] + "x" + endSquare
@@ -709,9 +856,6 @@ class Move():
             moveString += "x"
 
         moveString += endSquare
-        # if self.inCheck_instance and self.inCheck_instance.inCheck:
-        #     moveString += "+"
-
         return moveString
     
     @staticmethod
@@ -734,5 +878,6 @@ class Move():
 
         if pieceMoved[1] == 'p' and (endRow == 0 or endRow == 7):
             pawnPromotion = True
-        
-        return Move((startRow, startCol), (endRow, endCol), board, pawnPromotion)
+        promotionPiece = uci[4].upper() if len(uci) > 4 else 'Q'
+
+        return Move((startRow, startCol), (endRow, endCol), board, pawnPromotion, promotionPiece=promotionPiece)
@@ -1,6 +1,11 @@
+import copy
+import os
+import queue
 import sys
+import threading
+import traceback
 import pygame as p
-import ChessEngine, AiMoveScript, Aiscriptround172
+import ChessEngine, AiMoveScript, SmartMoveFinder
 
 # Constants
 BOARD_WIDTH = BOARD_HEIGHT = 512
@@ -10,17 +15,47 @@ DIMENSION = 8
 SQ_SIZE = BOARD_HEIGHT // DIMENSION
 MAX_FPS = 30
 IMAGES = {}
+PIECES = ['wp', 'wR', 'wN', 'wB', 'wQ', 'wK', 'bp', 'bR', 'bN', 'bB', 'bQ', 'bK']
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "images")
+# Pre-scaled atlases are saved here as atlas_<size>.png; set SPRITE_CACHE_DIR to "" to turn the disk cache off
+SPRITE_CACHE_DIR = os.environ.get("SPRITE_CACHE_DIR", os.path.join(IMAGE_DIR, "cache"))
+_spriteCache = {}  # square size -> {piece: sprite}
 
 # customize colors
 green1 = (235, 237, 209)
 green2 = (100, 164, 96)
 
 
-def loadImages():
-    """Load images for chess pieces."""
-    pieces = ['wp', 'wR', 'wN', 'wB', 'wQ', 'wK', 'bp', 'bR', 'bN', 'bB', 'bQ', 'bK']
-    for piece in pieces:
-        IMAGES[piece] = p.transform.scale(p.image.load("C:/Users/jetsa/OneDrive/Desktop/projectgraduate/Chess/ProjectFinal-ChessGame/images/" + piece + ".png"), (SQ_SIZE, SQ_SIZE))
+def loadImages(sqSize=SQ_SIZE):
+    """
+    Load the piece sprites at sqSize into IMAGES. All twelve are scaled once into a single atlas
+    converted for fast alpha blits, and each sprite is a subsurface of it. Atlases are kept per
+    square size, and on disk in SPRITE_CACHE_DIR so later starts skip the scaling.
+    """
+    if sqSize not in _spriteCache:
+        atlas = loadAtlas(sqSize).convert_alpha()
+        _spriteCache[sqSize] = {piece: atlas.subsurface((i * sqSize, 0, sqSize, sqSize)) for i, piece in enumerate(PIECES)}
+    IMAGES.update(_spriteCache[sqSize])
+
+
+def loadAtlas(sqSize):
+    """The atlas for sqSize: from the disk cache if it is newer than the piece images, otherwise built and cached."""
+    sources = [os.path.join(IMAGE_DIR, piece + ".png") for piece in PIECES]
+    cachePath = os.path.join(SPRITE_CACHE_DIR, f"atlas_{sqSize}.png") if SPRITE_CACHE_DIR else None
+    if cachePath and os.path.isfile(cachePath) and os.path.getmtime(cachePath) >= max(map(os.path.getmtime, sources)):
+        atlas = p.image.load(cachePath)
+        if atlas.get_size() == (len(PIECES) * sqSize, sqSize):
+            return atlas
+    atlas = p.Surface((len(PIECES) * sqSize, sqSize), p.SRCALPHA)
+    for i, source in enumerate(sources):
+        atlas.blit(p.transform.smoothscale(p.image.load(source), (sqSize, sqSize)), (i * sqSize, 0))
+    if cachePath:
+        try:
+            os.makedirs(SPRITE_CACHE_DIR, exist_ok=True)
+            p.image.save(atlas, cachePath)
+        except (OSError, p.error):
+            pass  # a read-only install just rebuilds the atlas on each start
+    return atlas
 
 
 def main():
@@ -35,12 +70,15 @@ def main():
     moveMade = False
     animate = False
     loadImages()
+    renderer = BoardRenderer(screen)
     running = True
     sqSelected = ()
     playerClicks = []
     gameOver = False
     playerOne = True  # (True = Human)
     playerTwo = True  # (True = Human)
+    aiTranspositionTable = {}  # kept for the whole game so the AI reuses earlier searches
+    aiSearch = None  # (thread, stopEvent, resultQueue) while the AI is thinking
     
 
     while running:
@@ -48,7 +86,10 @@ def main():
 
         for e in p.event.get():
             if e.type == p.QUIT:
+                aiSearch = cancelAiSearch(aiSearch)
                 running = False
+            elif e.type in (p.VIDEOEXPOSE, p.WINDOWEXPOSED):
+                renderer.invalidate()
             elif e.type == p.MOUSEBUTTONDOWN:
                 if not gameOver and humanTurn:
                     location = p.mouse.get_pos()
@@ -75,6 +116,7 @@ def main():
 
             elif e.type == p.KEYDOWN:
                 if e.key == p.K_z:  # Undo when 'z' is pressed
+                    aiSearch = cancelAiSearch(aiSearch)
                     if not gs.checkmate and not gs.stalemate:
                         gs.undoMove() 
                         moveMade = True
@@ -86,8 +128,10 @@ def main():
                         print("Cannot undo after checkmate or stalemate!")
             
                 if e.key == p.K_r:  # Reset when 'r' is pressed
+                    aiSearch = cancelAiSearch(aiSearch)
                     gs = ChessEngine.GameState()
                     validMoves = gs.getValidMoves()
+                    aiTranspositionTable = {}
                     sqSelected = ()
                     playerClicks = []
                     moveMade = False
@@ -95,11 +139,13 @@ def main():
                     gameOver = False 
                     print(f"Restart the game")
                 if e.key == p.K_t:  # Press 't' to Resign
+                    aiSearch = cancelAiSearch(aiSearch)
                     gameOver = True
                     winner = "Black" if gs.whiteToMove else "White"
                     print(f"{winner} wins by resignation!")
                 
                 if e.key == p.K_q:  # Press 'q' to Quit
+                    aiSearch = cancelAiSearch(aiSearch)
                     running = False
                     print(f"Quit game")
                     p.quit()
@@ -107,7 +153,6 @@ def main():
                     
         # AI Move
         if not gameOver and not humanTurn:
-            fen = gs.getFen()
             we = 2800
             be = 100
             # aiEloRating = 100
@@ -118,112 +163,235 @@ def main():
             #     aiEloRating = 1600  # Medium difficulty after 20 moves
             # else:
             #     aiEloRating = 2000  # Hard for endgame
-            # aiMove = AiMoveScript.adjustableBotElo(fen, time_limit=1.0, white_elo=we, black_elo=be)
-            aiMove = Aiscriptround172.findBestMove(fen)
-            if aiMove:
-                move = ChessEngine.Move.fromUci(aiMove, gs.board)
-                if abs(move.startCol - move.endCol) == 2 and move.pieceMoved[1].upper() == 'K':
-                    move.isCastleMove = True
-                    if move.pieceMoved[0] == 'w': #white castle
-                        if move.endCol > move.startCol: # Kingside castling (right)
-                            move.rookStartCol = 7
-                            move.rookEndCol = 5
-                        else: # Queenside castling (left)
-                            move.rookStartCol = 0
-                            move.rookEndCol = 3
-                    else: #black castle
-                        if move.endCol > move.startCol: # Kingside castling (right)
-                            move.rookStartCol = 7
-                            move.rookEndCol = 5
-                        else: # Queenside castling (left)
-                            move.rookStartCol = 0
-                            move.rookEndCol = 3
-                gs.makeMove(move)
-                moveMade = True
-                animate = True
+            # aiMove = AiMoveScript.adjustableBotElo(gs.getFen(), time_limit=1.0, white_elo=we, black_elo=be)
+            # The search runs on a background thread so the window keeps handling events and drawing
+            if aiSearch is None:
+                aiSearch = startAiSearch(gs, aiTranspositionTable)
+            else:
+                try:
+                    aiMove = aiSearch[2].get_nowait()
+                except queue.Empty:
+                    aiMove = None
+                else:
+                    aiSearch = None
+                if isinstance(aiMove, Exception):
+                    # Hand the AI's pieces to the player instead of retrying a search that keeps failing
+                    print(f"AI search failed: {aiMove!r}. {'White' if gs.whiteToMove else 'Black'} is now played by hand.")
+                    if gs.whiteToMove:
+                        playerOne = True
+                    else:
+                        playerTwo = True
+                elif aiMove:
+                    # The search ran on a copy of gs, so play the matching move from this position's list
+                    gs.makeMove(validMoves[validMoves.index(aiMove)])
+                    moveMade = True
+                    animate = True
 
         if moveMade:
             if animate:
-                animateMove(gs.moveLog[-1], screen, gs.board, clock)
+                renderer.animateMove(gs.undoStack[-1][0], gs.board, clock)
             validMoves = gs.getValidMoves()
             moveMade = False
             animate = False
 
-        drawGameState(screen, gs, validMoves, sqSelected, moveLogFont)
-
         if gs.checkmate or gs.stalemate:
             gameOver = True
-            drawEndGameText(screen, 'Stalemate' if gs.stalemate else 'Black wins by checkmate' if gs.whiteToMove else 'White wins by checkmate')
-
-        clock.tick(MAX_FPS)
-        p.display.flip()
-
-
-def drawGameState(screen, gs, validMoves, sqSelected, _):  # moveLogFont
-    drawBoard(screen)
-    highLightSquares(screen, gs, validMoves, sqSelected)
-    drawPiece(screen, gs.board)
-    # drawMoveLog(screen, gs, moveLogFont)
-    highlightLastMove(screen, gs)
-    
-
-def highlightLastMove(screen, gs):
-    moveLog = gs.moveLog
-    if moveLog:
-        lastMove = moveLog[-1]
-        highlightColor = (255, 255, 100, 128)
 
-        highlightSurface = p.Surface((SQ_SIZE, SQ_SIZE), p.SRCALPHA)
-        highlightSurface.fill(highlightColor)
-
-        startSquare = p.Rect(lastMove.startCol * SQ_SIZE, lastMove.startRow * SQ_SIZE, SQ_SIZE, SQ_SIZE)
-        screen.blit(highlightSurface, startSquare)
-
-        endSquare = p.Rect(lastMove.endCol * SQ_SIZE, lastMove.endRow * SQ_SIZE, SQ_SIZE, SQ_SIZE)
-        screen.blit(highlightSurface, endSquare)
-    drawPiece(screen, gs.board)
-
-        
-def drawBoard(screen):
-    colors = [p.Color(green1), p.Color(green2)]
-    for r in range(DIMENSION):
-        for c in range(DIMENSION):
-            color = colors[((r + c) % 2)]
-            rect = p.Rect(c * SQ_SIZE, r * SQ_SIZE, SQ_SIZE, SQ_SIZE)
-            p.draw.rect(screen, color, rect)
-
-
-def highLightSquares(screen, gs, validMoves, sqSelected):
-    if sqSelected != ():
-        r, c = sqSelected
-        if gs.board[r][c][0] == ('w' if gs.whiteToMove else 'b'):
-            s = p.Surface((SQ_SIZE, SQ_SIZE), p.SRCALPHA)
-
-            s.fill(p.Color(255, 255, 100, 128))
-            
-            screen.blit(s, (c * SQ_SIZE, r * SQ_SIZE))
+        # Overlays only change when their key does; the dots tick every 400 ms while the AI thinks
+        overlays = []
+        if aiSearch is not None:
+            dots = p.time.get_ticks() // 400 % 4
+            overlays.append(("thinking", dots, lambda: thinkingIndicator(moveLogFont, dots)))
+        if gs.checkmate or gs.stalemate:
+            text = 'Stalemate' if gs.stalemate else 'Black wins by checkmate' if gs.whiteToMove else 'White wins by checkmate'
+            overlays.append(("endGame", text, lambda: endGameText(text)))
+        renderer.draw(gs, validMoves, sqSelected, overlays)
 
-            for move in validMoves:
-                if move.startRow == r and move.startCol == c:
-                    validMoveSurface = p.Surface((SQ_SIZE, SQ_SIZE), p.SRCALPHA)
-                    
-                    if move.isCapture:
-                        p.draw.circle(validMoveSurface, (100, 100, 100, 200), (SQ_SIZE // 2, SQ_SIZE // 2), SQ_SIZE // 2.5, 5)
-                    else:
-                        p.draw.circle(validMoveSurface, (100, 100, 100, 200), (SQ_SIZE // 2, SQ_SIZE // 2), SQ_SIZE // 6)
-                    
-                    screen.blit(validMoveSurface, (move.endCol * SQ_SIZE, move.endRow * SQ_SIZE))
+        clock.tick(MAX_FPS)
 
-    if gs.checkmate or gs.stalemate:
-        return
 
+def startAiSearch(gs, transpositionTable):
+    """Search a copy of gs on a daemon thread. The chosen Move, or the exception the search raised, is put on the returned queue."""
+    searchState = copy.deepcopy(gs)
+    stopEvent = threading.Event()
+    resultQueue = queue.Queue()
+
+    def search():
+        try:
+            move = SmartMoveFinder.findBestMove(searchState, transpositionTable=transpositionTable, stopEvent=stopEvent)
+        except Exception as error:
+            traceback.print_exc()
+            move = error
+        if not stopEvent.is_set():
+            resultQueue.put(move)
+
+    thread = threading.Thread(target=search, name="AiSearch", daemon=True)
+    thread.start()
+    return thread, stopEvent, resultQueue
+
+
+def cancelAiSearch(aiSearch):
+    """Stop a running AI search and wait for its thread to finish; returns None for the caller to store."""
+    if aiSearch is not None:
+        thread, stopEvent, _ = aiSearch
+        stopEvent.set()
+        thread.join()
+    return None
+
+
+def thinkingIndicator(font, dots):
+    textObject = font.render("AI thinking" + "." * dots, True, p.Color('White'))
+    background = p.Surface((textObject.get_width() + 30, textObject.get_height() + 8), p.SRCALPHA)
+    background.fill((0, 0, 0, 160))
+    background.blit(textObject, (6, 4))
+    return background, (4, 4)
+
+
+def squareRect(square):
+    r, c = square
+    return p.Rect(c * SQ_SIZE, r * SQ_SIZE, SQ_SIZE, SQ_SIZE)
+
+
+def squaresUnder(rect):
+    rows = range(max(rect.top // SQ_SIZE, 0), min((rect.bottom - 1) // SQ_SIZE, DIMENSION - 1) + 1)
+    cols = range(max(rect.left // SQ_SIZE, 0), min((rect.right - 1) // SQ_SIZE, DIMENSION - 1) + 1)
+    return {(r, c) for r in rows for c in cols}
+
+
+class BoardRenderer:
+    """
+    Draws the game with dirty rectangles. The board background is drawn once; each frame only the
+    squares whose state (piece, selection, move hint, last-move highlight) differs from what is on
+    screen are redrawn, along with any overlay on top of them, and only those rectangles are passed
+    to display.update. Frames where nothing changed draw nothing.
+    """
+
+    def __init__(self, screen):
+        self.screen = screen
+        self.background = p.Surface((BOARD_WIDTH, BOARD_HEIGHT)).convert()
+        colors = [p.Color(green1), p.Color(green2)]
+        for r in range(DIMENSION):
+            for c in range(DIMENSION):
+                p.draw.rect(self.background, colors[(r + c) % 2], squareRect((r, c)))
+        self.highlight = p.Surface((SQ_SIZE, SQ_SIZE), p.SRCALPHA)
+        self.highlight.fill((255, 255, 100, 128))
+        self.markers = {}
+        for isCapture in (False, True):
+            marker = p.Surface((SQ_SIZE, SQ_SIZE), p.SRCALPHA)
+            if isCapture:
+                p.draw.circle(marker, (100, 100, 100, 200), (SQ_SIZE // 2, SQ_SIZE // 2), SQ_SIZE // 2.5, 5)
+            else:
+                p.draw.circle(marker, (100, 100, 100, 200), (SQ_SIZE // 2, SQ_SIZE // 2), SQ_SIZE // 6)
+            self.markers[isCapture] = marker
+        self.drawn = {}  # (row, col) -> state of the square as it is on screen
+        self.overlays = {}  # name -> (key, surface, rect) as it is on screen
+
+    def invalidate(self):
+        """Forget what is on screen, so the next draw repaints everything (e.g. after the window was exposed)."""
+        self.drawn.clear()
+        self.overlays.clear()
+
+    def squareStates(self, gs, validMoves, sqSelected):
+        """(piece, selected, move marker, last move) for every square."""
+        selected = None
+        markers = {}
+        if sqSelected != ():
+            r, c = sqSelected
+            if gs.board[r][c][0] == ('w' if gs.whiteToMove else 'b'):
+                selected = sqSelected
+                for move in validMoves:
+                    if move.startRow == r and move.startCol == c:
+                        markers[(move.endRow, move.endCol)] = move.isCapture
+        lastMove = gs.undoStack[-1][0] if gs.undoStack else None
+        lastSquares = {(lastMove.startRow, lastMove.startCol), (lastMove.endRow, lastMove.endCol)} if lastMove else ()
+        return {(r, c): (gs.board[r][c], (r, c) == selected, markers.get((r, c)), (r, c) in lastSquares)
+                for r in range(DIMENSION) for c in range(DIMENSION)}
+
+    def drawSquare(self, square, state):
+        piece, selected, marker, lastMove = state
+        rect = squareRect(square)
+        self.screen.blit(self.background, rect, rect)
+        if selected:
+            self.screen.blit(self.highlight, rect)
+        if marker is not None:
+            self.screen.blit(self.markers[marker], rect)
+        if lastMove:
+            self.screen.blit(self.highlight, rect)
+        if piece != "--":
+            self.screen.blit(IMAGES[piece], rect)
+
+    def draw(self, gs, validMoves, sqSelected, overlays=()):
+        """
+        Bring the screen up to date with gs. overlays are (name, key, build) drawn over the board in
+        order; build() returns (surface, position) and is only called when the key changes.
+        """
+        states = self.squareStates(gs, validMoves, sqSelected)
+        dirty = {square for square, state in states.items() if self.drawn.get(square) != state}
+
+        current = {}
+        for name, key, build in overlays:
+            previous = self.overlays.get(name)
+            if previous is not None and previous[0] == key:
+                current[name] = previous
+            else:
+                surface, position = build()
+                current[name] = (key, surface, surface.get_rect(topleft=position))
+        for name in self.overlays.keys() | current.keys():
+            if self.overlays.get(name) is not current.get(name):
+                for _, _, rect in filter(None, (self.overlays.get(name), current.get(name))):
+                    dirty |= squaresUnder(rect)
+        # Overlays are translucent, so one that has to be redrawn needs clean squares under all of it
+        for _, _, rect in current.values():
+            under = squaresUnder(rect)
+            if under & dirty:
+                dirty |= under
+        self.overlays = current
+        if not dirty:
+            return
+
+        for square in dirty:
+            self.drawSquare(square, states[square])
+            self.drawn[square] = states[square]
+        for _, surface, rect in current.values():
+            if squaresUnder(rect) & dirty:
+                self.screen.blit(surface, rect)
+        p.display.update([squareRect(square) for square in dirty])
+
+    def animateMove(self, move, board, clock):
+        """Slide the moved piece to its end square (board is already after the move), updating only the squares it crosses."""
+        dR = move.endRow - move.startRow
+        dC = move.endCol - move.startCol
+        baseFramePerSquare = 20
+        maxFrames = 40
+        framePerSquare = min(baseFramePerSquare, maxFrames // (abs(dR) + abs(dC) + 1))
+        frameCount = (abs(dR) + abs(dC)) * framePerSquare
+
+        # Until the piece lands, its end square still shows whatever was captured
+        before = {(move.endRow, move.endCol): "--"}
+        if move.pieceCaptured != "--":
+            if move.isEnpassantMove:
+                enPassantRow = (move.endRow + 1) if move.pieceCaptured[0] == 'b' else move.endRow - 1
+                before[(enPassantRow, move.endCol)] = move.pieceCaptured
+            else:
+                before[(move.endRow, move.endCol)] = move.pieceCaptured
+
+        crossed = set()
+        previous = None
+        for frame in range(frameCount + 1):
+            r, c = ((move.startRow + dR * frame / frameCount), (move.startCol + dC * frame / frameCount))
+            pieceRect = p.Rect(c * SQ_SIZE, r * SQ_SIZE, SQ_SIZE, SQ_SIZE)
+            area = pieceRect.union(previous) if previous else pieceRect
+            for square in squaresUnder(area):
+                highlights = self.drawn.get(square, (None, False, None, False))[1:]
+                self.drawSquare(square, (before.get(square, board[square[0]][square[1]]),) + highlights)
+                crossed.add(square)
+            self.screen.blit(IMAGES[move.pieceMoved], pieceRect)
+            p.display.update(area)
+            previous = pieceRect
+            clock.tick(120)
+        for square in crossed:  # the next draw puts these back in their real state
+            self.drawn.pop(square, None)
 
-def drawPiece(screen, board):
-    for r in range(DIMENSION):
-        for c in range(DIMENSION):
-            piece = board[r][c]
-            if piece != "--":
-                screen.blit(IMAGES[piece], p.Rect(c * SQ_SIZE, r * SQ_SIZE, SQ_SIZE, SQ_SIZE))
 
 # def drawMoveLog(screen, gs, font):
 #     moveLogRect = p.Rect(BOARD_WIDTH, 0, MOVE_LOG_PANEL_WIDTH, MOVE_LOG_HEIGHT)
@@ -252,46 +420,14 @@ def drawPiece(screen, board):
 #         textY += textObject.get_height() + lineSpacing
 
 
-def animateMove(move, screen, board, clock):
-    dR = move.endRow - move.startRow
-    dC = move.endCol - move.startCol
-    baseFramePerSquare = 20
-    maxFrames = 40
-    framePerSquare = min(baseFramePerSquare, maxFrames // (abs(dR) + abs(dC) + 1))
-    
-    frameCount = (abs(dR) + abs(dC)) * framePerSquare
-    for frame in range(frameCount + 1):
-        r, c = ((move.startRow + dR * frame / frameCount), (move.startCol + dC * frame / frameCount))
-        
-        drawBoard(screen)
-        drawPiece(screen, board)
-        
-        # color = colors[(move.endRow + move.endCol) % 2]
-        # startSquare = p.Rect(move.startCol * SQ_SIZE, move.startRow * SQ_SIZE, SQ_SIZE, SQ_SIZE)
-        endSquare = p.Rect(move.endCol * SQ_SIZE, move.endRow * SQ_SIZE, SQ_SIZE, SQ_SIZE)
-        # p.draw.rect(screen, color, startSquare)
-        # p.draw.rect(screen, color, endSquare)
-
-        if move.pieceCaptured != "--":
-            if move.isEnpassantMove:
-                enPassantRow = (move.endRow + 1) if move.pieceCaptured[0] == 'b' else move.endRow - 1
-                endSquare = p.Rect(move.endCol * SQ_SIZE, enPassantRow * SQ_SIZE, SQ_SIZE, SQ_SIZE)
-            screen.blit(IMAGES[move.pieceCaptured], endSquare)
-
-        screen.blit(IMAGES[move.pieceMoved], p.Rect(c * SQ_SIZE, r * SQ_SIZE, SQ_SIZE, SQ_SIZE))
-        drawBoard(screen)
-        drawPiece(screen, board)
-        p.display.flip()
-        clock.tick(120)
-
-
-def drawEndGameText(screen, text):
+def endGameText(text):
     font = p.font.SysFont("Helvitca", 48, True, False)
     textObject = font.render(text, 0, p.Color('White'))
-    textLocation = p.Rect(0, 0, BOARD_WIDTH, BOARD_HEIGHT).move(BOARD_WIDTH / 2 - textObject.get_width() / 2, BOARD_HEIGHT / 2 - textObject.get_height() / 2)
-    screen.blit(textObject, textLocation)
-    textObject = font.render(text, 0, p.Color('Black'))
-    screen.blit(textObject, textLocation.move(2, 2))
+    shadow = font.render(text, 0, p.Color('Black'))
+    surface = p.Surface((textObject.get_width() + 2, textObject.get_height() + 2), p.SRCALPHA)
+    surface.blit(textObject, (0, 0))
+    surface.blit(shadow, (2, 2))
+    return surface, (BOARD_WIDTH // 2 - textObject.get_width() // 2, BOARD_HEIGHT // 2 - textObject.get_height() // 2)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,60 @@
+"""
+Minimal UCI engine for exercising AiMoveScript.EnginePool without Stockfish installed.
+
+It answers the UCI handshake, accepts the options the pool sets, and replies to every
+"go" with a random legal move. --crash-after N exits abruptly after N searches, to test
+that the pool restarts dead engines:
+
+    pool = AiMoveScript.EnginePool([sys.executable, "FakeUciEngine.py", "--crash-after", "3"], size=2)
+"""
+import argparse
+import random
+import sys
+
+import chess
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake UCI engine that plays random legal moves")
+    parser.add_argument("--crash-after", type=int, default=None, help="exit without a reply after this many searches")
+    args = parser.parse_args()
+
+    board = chess.Board()
+    searches = 0
+    for line in sys.stdin:
+        tokens = line.split()
+        if not tokens:
+            continue
+        command = tokens[0]
+        if command == "uci":
+            print("id name FakeUciEngine")
+            print("id author ChessGame")
+            print("option name Threads type spin default 1 min 1 max 64")
+            print("option name Hash type spin default 16 min 1 max 1024")
+            print("option name Skill Level type spin default 20 min 0 max 20")
+            print("uciok")
+        elif command == "isready":
+            print("readyok")
+        elif command == "position":
+            if tokens[1] == "startpos":
+                board = chess.Board()
+                rest = tokens[2:]
+            else:
+                board = chess.Board(" ".join(tokens[2:8]))
+                rest = tokens[8:]
+            if rest and rest[0] == "moves":
+                for uci in rest[1:]:
+                    board.push_uci(uci)
+        elif command == "go":
+            searches += 1
+            if args.crash_after is not None and searches > args.crash_after:
+                sys.exit(1)
+            moves = list(board.legal_moves)
+            print("bestmove " + (random.choice(moves).uci() if moves else "0000"))
+        elif command == "quit":
+            break
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Polyglot opening book for the AI.
+
+findBookMove looks the position up in a Polyglot .bin book before any search is run. The book
+file is memory-mapped and searched with a binary search on the Polyglot Zobrist key (python-chess'
+MemoryMappedReader), and a move is picked at random in proportion to its weight. Positions deeper
+than the configured maximum ply are never looked up.
+
+The book is configured from the environment:
+    OPENING_BOOK_PATH     book file (default book.bin next to this module; no book if missing)
+    OPENING_BOOK_MAX_PLY  last ply at which the book is consulted (default 20)
+
+Build a book from a local PGN collection:
+
+    python OpeningBook.py games.pgn book.bin --max-ply 20 --min-games 2
+"""
+import argparse
+import atexit
+import os
+import random
+import struct
+import sys
+import threading
+from collections import defaultdict
+
+import chess
+import chess.pgn
+import chess.polyglot
+
+OPENING_BOOK_PATH = os.environ.get("OPENING_BOOK_PATH") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "book.bin")
+OPENING_BOOK_MAX_PLY = int(os.environ.get("OPENING_BOOK_MAX_PLY", 20))
+ENTRY_STRUCT = struct.Struct(">QHHI")  # key, move, weight, learn
+MAX_WEIGHT = 0xFFFF
+
+_book_reader = None
+_book_path = None
+_book_lock = threading.Lock()
+
+
+def getBookReader(path=None):
+    """Return the memory-mapped reader for the book at path, opened on first use, or None if there is no book."""
+    global _book_reader, _book_path
+    path = path or OPENING_BOOK_PATH
+    with _book_lock:
+        if _book_path != path:
+            closeBook()
+            _book_path = path
+            if os.path.isfile(path) and os.path.getsize(path) > 0:
+                _book_reader = chess.polyglot.open_reader(path)
+        return _book_reader
+
+
+def closeBook():
+    global _book_reader, _book_path
+    if _book_reader is not None:
+        _book_reader.close()
+    _book_reader = None
+    _book_path = None
+
+
+atexit.register(closeBook)
+
+
+def findBookMove(board, max_ply=OPENING_BOOK_MAX_PLY, path=None, rng=random):
+    """
+    Return a weighted random book move for board as a chess.Move, or None when the position is
+    past max_ply, not in the book, or there is no book.
+    """
+    if board.ply() > max_ply:
+        return None
+    reader = getBookReader(path)
+    if reader is None:
+        return None
+    try:
+        return reader.weighted_choice(board, random=rng).move
+    except IndexError:  # position not in the book, or every entry has weight 0
+        return None
+
+
+def encodeMove(board, move):
+    """
+    A move in Polyglot's 16 bit format: to square in bits 0-5, from square in bits 6-11 and the
+    promotion piece (1 knight ... 4 queen) in bits 12-14. Castling is written as the king capturing its rook.
+    """
+    to_square = move.to_square
+    if board.is_kingside_castling(move):
+        to_square = chess.square(7, chess.square_rank(move.from_square))
+    elif board.is_queenside_castling(move):
+        to_square = chess.square(0, chess.square_rank(move.from_square))
+    promotion = move.promotion - 1 if move.promotion else 0
+    return to_square | move.from_square << 6 | promotion << 12
+
+
+def buildBook(pgn_path, book_path, max_ply=OPENING_BOOK_MAX_PLY, min_games=1):
+    """
+    Write a Polyglot book of every move played in the first max_ply plies of the games in pgn_path.
+    A move scores 2 per game its side won and 1 per draw; moves seen in fewer than min_games games
+    are left out and the scores of each position are scaled to fit Polyglot's 16 bit weights.
+    Returns (games read, entries written).
+    """
+    games_seen = defaultdict(int)  # (key, move) -> games
+    scores = defaultdict(int)
+    games = 0
+    with open(pgn_path, encoding="utf-8", errors="replace") as pgn:
+        while True:
+            game = chess.pgn.read_game(pgn)
+            if game is None:
+                break
+            games += 1
+            result = game.headers.get("Result", "*")
+            points = {chess.WHITE: {"1-0": 2, "1/2-1/2": 1}.get(result, 0),
+                      chess.BLACK: {"0-1": 2, "1/2-1/2": 1}.get(result, 0)}
+            board = game.board()
+            for move in game.mainline_moves():
+                if board.ply() >= max_ply:
+                    break
+                entry = (chess.polyglot.zobrist_hash(board), encodeMove(board, move))
+                games_seen[entry] += 1
+                scores[entry] += points[board.turn]
+                board.push(move)
+
+    by_key = defaultdict(list)
+    for (key, move), count in games_seen.items():
+        if count >= min_games:
+            by_key[key].append((scores[(key, move)], move))
+    entries = []
+    for key, moves in by_key.items():
+        top = max(score for score, _ in moves)
+        scale = min(1.0, MAX_WEIGHT / top) if top else 1.0
+        for score, move in sorted(moves, reverse=True):
+            # Moves that only lost keep weight 1, so the book still knows them
+            entries.append((key, move, max(1, int(score * scale))))
+    entries.sort(key=lambda entry: entry[0])  # the reader's binary search needs key order
+    with open(book_path, "wb") as book:
+        for key, move, weight in entries:
+            book.write(ENTRY_STRUCT.pack(key, move, weight, 0))
+    return games, len(entries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a Polyglot opening book from a PGN collection")
+    parser.add_argument("pgn", help="PGN file to read")
+    parser.add_argument("book", help="Polyglot .bin file to write")
+    parser.add_argument("--max-ply", type=int, default=OPENING_BOOK_MAX_PLY, help="plies per game to include")
+    parser.add_argument("--min-games", type=int, default=1, help="leave out moves played in fewer games")
+    args = parser.parse_args()
+    games, entries = buildBook(args.pgn, args.book, args.max_ply, args.min_games)
+    print(f"{games} games, {entries} book entries written to {args.book}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
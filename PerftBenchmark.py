@@ -0,0 +1,108 @@
+"""
+Perft correctness suite and move generator benchmark.
+
+Counts every leaf of the legal move tree from well known positions with GameState.perft
+and compares the totals with the published values, reporting nodes per second for each
+position and depth. Run it after any change to move generation:
+
+    python PerftBenchmark.py --depth 3 --backend both
+
+--raw times the bitboard generator alone: BitboardBackend.perft plays move codes on the
+bitboards without makeMove/undoMove, so it skips everything real play goes through.
+"""
+import argparse
+import sys
+import time
+
+import ChessEngine
+
+# (name, FEN, expected node counts for depth 1, 2, 3, ...)
+PERFT_POSITIONS = [
+    ("start position", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+     [20, 400, 8902, 197281, 4865609]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     [48, 2039, 97862, 4085603]),
+    ("position 3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     [14, 191, 2812, 43238, 674624]),
+    ("position 4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     [6, 264, 9467, 422333]),
+    ("position 5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     [44, 1486, 62379, 2103487]),
+    ("position 6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     [46, 2079, 89890, 3894594]),
+    # En passant edge cases
+    ("en passant exposes king", "3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1", [18, 92, 1670, 10138]),
+    ("en passant gives check", "8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1", [15, 126, 1928, 13931]),
+    ("en passant out of check", "8/8/4k3/8/2p5/8/B2P2K1/8 w - - 0 1", [13, 102, 1266, 10276]),
+    ("castling gives check", "5k2/8/8/8/8/8/8/4K2R w K - 0 1", [15, 66, 1198, 6399]),
+    # Promotion edge cases
+    ("promotion out of check", "n1n5/PPPk4/8/8/8/8/4Kppp/5N1N b - - 0 1", [24, 496, 9483, 182838]),
+    ("underpromotion check", "8/P1k5/K7/8/8/8/8/8 w - - 0 1", [6, 27, 273, 1329]),
+    ("promotion check", "4k3/1P6/8/8/8/8/K7/8 w - - 0 1", [9, 40, 472, 2661]),
+]
+
+
+def runPerft(fen, depth, backend="mailbox"):
+    """Return (nodes, seconds) for a perft of the given depth from fen. Backend "raw" is the bitboard code-only walk."""
+    gs = ChessEngine.GameState.fromFen(fen, backend="bitboard" if backend == "raw" else backend)
+    start = time.perf_counter()
+    nodes = gs.bitboards.perft(depth) if backend == "raw" else gs.perft(depth)
+    return nodes, time.perf_counter() - start
+
+
+def runSuite(maxDepth, backends, names=None):
+    """Run every position up to maxDepth on each backend, print a report and return the number of mismatches."""
+    failures = 0
+    for backend in backends:
+        print("--- raw bitboard generator, no makeMove/undoMove ---" if backend == "raw" else f"--- {backend} ---")
+        totalNodes = 0
+        totalTime = 0.0
+        for name, fen, expected in PERFT_POSITIONS:
+            if names and name not in names:
+                continue
+            for depth in range(1, min(maxDepth, len(expected)) + 1):
+                nodes, seconds = runPerft(fen, depth, backend)
+                totalNodes += nodes
+                totalTime += seconds
+                status = "ok" if nodes == expected[depth - 1] else f"FAIL (expected {expected[depth - 1]})"
+                if nodes != expected[depth - 1]:
+                    failures += 1
+                print(f"{name:<26} depth {depth}  {nodes:>9} nodes  {seconds:8.3f}s  "
+                      f"{nodes / seconds if seconds else 0:>10.0f} nodes/s  {status}")
+        if totalTime:
+            print(f"total: {totalNodes} nodes in {totalTime:.3f}s, {totalNodes / totalTime:.0f} nodes/s")
+    return failures
+
+
+def printDivide(fen, depth, backend):
+    gs = ChessEngine.GameState.fromFen(fen, backend=backend)
+    counts = gs.divide(depth)
+    for move in sorted(counts):
+        print(f"{move}: {counts[move]}")
+    print(f"moves: {len(counts)}  nodes: {sum(counts.values())}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Perft correctness suite and move generator benchmark")
+    parser.add_argument("--depth", type=int, default=3, help="deepest perft depth to run (default 3)")
+    parser.add_argument("--backend", choices=("mailbox", "bitboard", "both"), default="both")
+    parser.add_argument("--position", action="append", help="only run the named position (repeatable)")
+    parser.add_argument("--divide", metavar="FEN", help="print per-move node counts for FEN at --depth")
+    parser.add_argument("--raw", action="store_true",
+                        help="also time the bitboard generator alone, on move codes without makeMove/undoMove")
+    args = parser.parse_args()
+
+    backends = ("mailbox", "bitboard") if args.backend == "both" else (args.backend,)
+    if args.raw:
+        backends += ("raw",)
+    if args.divide:
+        printDivide(args.divide, args.depth, backends[0])
+        return 0
+    failures = runSuite(args.depth, backends, args.position)
+    if failures:
+        print(f"{failures} perft mismatches")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
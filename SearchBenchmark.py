@@ -0,0 +1,75 @@
+"""
+Root-parallel search benchmark for Aiscriptround172.
+
+Searches each position to a fixed depth with 1, 2, 4... worker processes and reports the time to
+depth, the speedup over one worker and the parallel efficiency. The single-worker run is the
+in-process serial search. Each pool is started and warmed up before it is timed:
+
+    python SearchBenchmark.py --depth 4 --workers 1 2 4 8
+"""
+import argparse
+import os
+import sys
+import time
+
+import Aiscriptround172
+
+# (name, FEN) of quiet and tactical middlegames
+SEARCH_POSITIONS = [
+    ("start position", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"),
+    ("position 6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10"),
+    ("italian", "r1bqk2r/pppp1ppp/2n2n2/2b1p3/2B1P3/2NP1N2/PPP2PPP/R1BQK2R b KQkq - 0 5"),
+]
+
+
+def timeToDepth(fen, depth, workers):
+    """Return (best move, seconds) for a fixed-depth search from a cold transposition table, bypassing the opening book."""
+    Aiscriptround172.move_history.clear()
+    Aiscriptround172.transposition_table.clear()
+    if workers > 1:
+        # Start the worker processes outside the timed region
+        Aiscriptround172.shutdown_search_pool()
+        Aiscriptround172.findBestMove(fen, time_limit=None, max_depth=1, workers=workers, use_book=False)
+        Aiscriptround172.move_history.clear()
+    start = time.perf_counter()
+    move = Aiscriptround172.findBestMove(fen, time_limit=None, max_depth=depth, workers=workers, use_book=False)
+    return move, time.perf_counter() - start
+
+
+def runBenchmark(depth, workerCounts, names=None):
+    """Print time to depth per position and worker count, then the total speedup per worker count."""
+    totals = dict.fromkeys(workerCounts, 0.0)
+    for name, fen in SEARCH_POSITIONS:
+        if names and name not in names:
+            continue
+        baseline = None
+        for workers in workerCounts:
+            move, seconds = timeToDepth(fen, depth, workers)
+            totals[workers] += seconds
+            baseline = baseline or seconds
+            print(f"{name:<16} depth {depth}  workers {workers:>2}  {move}  {seconds:8.3f}s  "
+                  f"speedup {baseline / seconds:5.2f}  efficiency {baseline / seconds / workers:5.2f}")
+    baseline = totals[workerCounts[0]]
+    print("--- total ---")
+    for workers in workerCounts:
+        seconds = totals[workers]
+        print(f"workers {workers:>2}  {seconds:8.3f}s  speedup {baseline / seconds if seconds else 0:5.2f}")
+    Aiscriptround172.shutdown_search_pool()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Root-parallel search speedup benchmark")
+    parser.add_argument("--depth", type=int, default=4, help="search depth to time (default 4)")
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=sorted({1, 2, 4, os.cpu_count() or 1}),
+                        help="worker counts to compare; the first is the baseline (default 1 2 4 and the CPU count)")
+    parser.add_argument("--position", action="append", help="only run the named position (repeatable)")
+    args = parser.parse_args()
+    print(f"{os.cpu_count()} CPUs")
+    runBenchmark(args.depth, args.workers, args.position)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+"""
+Headless self-play runner.
+
+Plays games between two agents without the pygame window, using ChessEngine.GameState for the
+rules. Games are spread over a process pool, and each finished game is appended to the PGN and
+JSONL outputs straight away. At the end it reports games/hour, average move latency per agent
+and the win/draw/loss record. Colors alternate between games.
+
+Agents are given as name[:parameter]:
+    random            uniformly random legal move
+    ai172[:seconds]   Aiscriptround172.findBestMove with that time limit per move
+    smart[:seconds]   SmartMoveFinder.findBestMove on the GameState itself
+    stockfish[:elo]   AiMoveScript.adjustableBotElo at that Elo
+
+    python SelfPlay.py --games 20 --agent1 ai172:0.5 --agent2 random --pgn games.pgn --jsonl games.jsonl
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import chess
+import chess.pgn
+
+import ChessEngine
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+MAX_PLIES = 300  # longer games are adjudicated as draws
+DEFAULT_AI_TIME = 0.5
+DEFAULT_STOCKFISH_ELO = 1500
+
+
+def makeAgent(spec, rng):
+    """Return a function (gs, validMoves) -> Move for an agent spec such as 'random' or 'ai172:1.0'."""
+    name, _, parameter = spec.partition(":")
+    if name == "random":
+        return lambda gs, validMoves: rng.choice(validMoves)
+    if name == "ai172":
+        import Aiscriptround172
+        timeLimit = float(parameter or DEFAULT_AI_TIME)
+        # Each game starts with a clean search state, whatever this worker played before
+        Aiscriptround172.move_history.clear()
+        Aiscriptround172.transposition_table.clear()
+        # Games already run one per process, so each search stays in its own process
+        return uciAgent(lambda fen: Aiscriptround172.findBestMove(fen, time_limit=timeLimit, workers=1))
+    if name == "smart":
+        import SmartMoveFinder
+        timeLimit = float(parameter or DEFAULT_AI_TIME)
+        transpositionTable = {}
+        return lambda gs, validMoves: SmartMoveFinder.findBestMove(gs, validMoves, timeLimit=timeLimit,
+                                                                   transpositionTable=transpositionTable)
+    if name == "stockfish":
+        import AiMoveScript
+        elo = int(parameter or DEFAULT_STOCKFISH_ELO)
+        return uciAgent(lambda fen: AiMoveScript.adjustableBotElo(fen, white_elo=elo, black_elo=elo, time_limit=DEFAULT_AI_TIME))
+    raise ValueError(f"Unknown agent '{spec}'")
+
+
+def uciAgent(findMove):
+    """Wrap a FEN -> UCI string engine so it returns one of the GameState's valid moves."""
+    def agent(gs, validMoves):
+        uci = findMove(gs.getFen())
+        if uci is None:
+            raise RuntimeError("agent returned no move")
+        move = ChessEngine.Move.fromUci(uci, gs.board)
+        return validMoves[validMoves.index(move)]
+    return agent
+
+
+def playGame(index, whiteSpec, blackSpec, fen=START_FEN, maxPlies=MAX_PLIES, seed=None):
+    """Play one game and return its record as a dict (moves in UCI, result, termination, timings)."""
+    rng = random.Random(seed)
+    agents = {True: makeAgent(whiteSpec, rng), False: makeAgent(blackSpec, rng)}
+    moveTimes = {True: [], False: []}
+    gs = ChessEngine.GameState.fromFen(fen)
+    validMoves = gs.getValidMoves()
+    moves = []
+    start = time.perf_counter()
+    while not gs.checkmate and not gs.stalemate and len(moves) < maxPlies:
+        whiteToMove = gs.whiteToMove
+        moveStart = time.perf_counter()
+        move = agents[whiteToMove](gs, validMoves)
+        moveTimes[whiteToMove].append(time.perf_counter() - moveStart)
+        gs.makeMove(move)
+        moves.append(move.getUci())
+        validMoves = gs.getValidMoves()
+
+    termination = gs.getStatus() or "move limit"
+    if termination == "checkmate":
+        result = "0-1" if gs.whiteToMove else "1-0"
+    else:
+        result = "1/2-1/2"
+    return {
+        "index": index,
+        "white": whiteSpec,
+        "black": blackSpec,
+        "fen": fen,
+        "result": result,
+        "termination": termination,
+        "plies": len(moves),
+        "moves": moves,
+        "seconds": time.perf_counter() - start,
+        "whiteMoveTimes": moveTimes[True],
+        "blackMoveTimes": moveTimes[False],
+    }
+
+
+def toPgn(record):
+    board = chess.Board(record["fen"])
+    game = chess.pgn.Game.from_board(board)
+    game.headers["Event"] = "Self-play"
+    game.headers["Round"] = str(record["index"] + 1)
+    game.headers["White"] = record["white"]
+    game.headers["Black"] = record["black"]
+    game.headers["Result"] = record["result"]
+    game.headers["Termination"] = record["termination"]
+    node = game
+    for uci in record["moves"]:
+        node = node.add_variation(chess.Move.from_uci(uci))
+    return str(game)
+
+
+def runMatch(agent1, agent2, games, workers, pgnPath=None, jsonlPath=None, fen=START_FEN, maxPlies=MAX_PLIES, seed=None):
+    """Play the match across a process pool, streaming each finished game to the outputs. Returns the summary dict."""
+    # agent1 plays white in even-numbered games
+    pairings = [(agent1, agent2) if i % 2 == 0 else (agent2, agent1) for i in range(games)]
+    score = {"wins": 0, "draws": 0, "losses": 0}  # from agent1's point of view
+    moveTimes = {agent1: [], agent2: []} if agent1 != agent2 else {agent1: []}
+    pgnFile = open(pgnPath, "a") if pgnPath else None
+    jsonlFile = open(jsonlPath, "a") if jsonlPath else None
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(playGame, i, white, black, fen, maxPlies, None if seed is None else seed + i)
+                       for i, (white, black) in enumerate(pairings)]
+            for finished, future in enumerate(as_completed(futures), 1):
+                record = future.result()
+                moveTimes[record["white"]].extend(record["whiteMoveTimes"])
+                moveTimes[record["black"]].extend(record["blackMoveTimes"])
+                if record["result"] == "1/2-1/2":
+                    score["draws"] += 1
+                elif (record["result"] == "1-0") == (record["index"] % 2 == 0):
+                    score["wins"] += 1
+                else:
+                    score["losses"] += 1
+                if pgnFile:
+                    pgnFile.write(toPgn(record) + "\n\n")
+                    pgnFile.flush()
+                if jsonlFile:
+                    jsonlFile.write(json.dumps(record) + "\n")
+                    jsonlFile.flush()
+                print(f"[{finished}/{games}] game {record['index'] + 1}: {record['white']} - {record['black']}  "
+                      f"{record['result']} ({record['termination']}, {record['plies']} plies, {record['seconds']:.1f}s)")
+    finally:
+        if pgnFile:
+            pgnFile.close()
+        if jsonlFile:
+            jsonlFile.close()
+    elapsed = time.perf_counter() - start
+    return {
+        "games": games,
+        "seconds": elapsed,
+        "gamesPerHour": games * 3600 / elapsed if elapsed else 0,
+        "moveLatency": {agent: sum(times) / len(times) if times else 0 for agent, times in moveTimes.items()},
+        **score,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless self-play between two agents")
+    parser.add_argument("--games", type=int, default=10)
+    parser.add_argument("--agent1", default="ai172", help="first agent, white in odd games (default ai172)")
+    parser.add_argument("--agent2", default="random", help="second agent (default random)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="parallel games (default CPU count)")
+    parser.add_argument("--pgn", help="append finished games to this PGN file")
+    parser.add_argument("--jsonl", help="append one JSON record per finished game to this file")
+    parser.add_argument("--fen", default=START_FEN, help="starting position")
+    parser.add_argument("--max-plies", type=int, default=MAX_PLIES, help="adjudicate a draw after this many plies")
+    parser.add_argument("--seed", type=int, help="seed for the random agent; game i uses seed + i")
+    args = parser.parse_args()
+
+    summary = runMatch(args.agent1, args.agent2, args.games, args.workers, args.pgn, args.jsonl,
+                       args.fen, args.max_plies, args.seed)
+    print(f"{summary['games']} games in {summary['seconds']:.1f}s, {summary['gamesPerHour']:.0f} games/hour")
+    for agent, latency in summary["moveLatency"].items():
+        print(f"{agent}: {latency * 1000:.1f} ms/move")
+    print(f"{args.agent1} vs {args.agent2}: +{summary['wins']} ={summary['draws']} -{summary['losses']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,226 @@
+"""
+Native AI search on ChessEngine.GameState.
+
+Searches with getValidMoves/makeMove/undoMove and returns one of the Move objects, so an AI
+turn needs no FEN round trip, no python-chess board and no UCI conversion back to a Move.
+"""
+import math
+import time
+
+pieceScore = {'K': 0, 'Q': 900, 'R': 500, 'B': 330, 'N': 320, 'p': 100}
+
+# Piece-square tables for white, laid out like GameState.board (row 0 is rank 8).
+# Black pieces read the table upside down.
+knightScores = [
+    [-50, -40, -30, -30, -30, -30, -40, -50],
+    [-40, -20,   0,   0,   0,   0, -20, -40],
+    [-30,   0,  10,  15,  15,  10,   0, -30],
+    [-30,   5,  15,  20,  20,  15,   5, -30],
+    [-30,   0,  15,  20,  20,  15,   0, -30],
+    [-30,   5,  10,  15,  15,  10,   5, -30],
+    [-40, -20,   0,   5,   5,   0, -20, -40],
+    [-50, -40, -30, -30, -30, -30, -40, -50],
+]
+pawnScores = [
+    [ 0,  0,   0,   0,   0,   0,  0,  0],
+    [50, 50,  50,  50,  50,  50, 50, 50],
+    [10, 10,  20,  30,  30,  20, 10, 10],
+    [ 5,  5,  10,  25,  25,  10,  5,  5],
+    [ 0,  0,   0,  20,  20,   0,  0,  0],
+    [ 5, -5, -10,   0,   0, -10, -5,  5],
+    [ 5, 10,  10, -20, -20,  10, 10,  5],
+    [ 0,  0,   0,   0,   0,   0,  0,  0],
+]
+piecePositionScores = {'N': knightScores, 'p': pawnScores}
+
+CHECKMATE = 100000
+STALEMATE = 0
+DEFAULT_TIME_LIMIT = 2.0  # seconds per move
+MAX_DEPTH = 32
+QUIESCENCE_DEPTH = 4
+TT_MAX_ENTRIES = 200000
+# Mate scores are CHECKMATE minus the ply of the mate, which is at most MAX_DEPTH plus the quiescence plies
+MATE_BOUND = CHECKMATE - MAX_DEPTH - QUIESCENCE_DEPTH
+
+# Transposition table bound types
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+def scoreToTT(score, ply):
+    """Mate scores are stored relative to the node, not the root, so they stay valid wherever it transposes."""
+    if score >= MATE_BOUND:
+        return score + ply
+    if score <= -MATE_BOUND:
+        return score - ply
+    return score
+
+
+def scoreFromTT(score, ply):
+    if score >= MATE_BOUND:
+        return score - ply
+    if score <= -MATE_BOUND:
+        return score + ply
+    return score
+
+
+class SearchTimeout(Exception):
+    """Raised inside the search when the time budget runs out or the search is stopped."""
+
+
+class Searcher:
+    """One AI search on a GameState: iterative deepening negamax with alpha-beta and a transposition table."""
+
+    def __init__(self, gs, timeLimit=DEFAULT_TIME_LIMIT, maxDepth=MAX_DEPTH, transpositionTable=None, stopEvent=None):
+        self.gs = gs
+        self.timeLimit = timeLimit
+        self.maxDepth = maxDepth
+        self.stopEvent = stopEvent  # threading.Event another thread sets to abandon the search
+        # zobristKey -> (depth, bound, score, moveID of the best move)
+        self.transpositionTable = transpositionTable if transpositionTable is not None else {}
+        self.startTime = time.perf_counter()
+        self.deadline = None
+        self.nodes = 0
+
+    def search(self, validMoves=None):
+        """Return the best move of the deepest completed iteration, or None if there are no moves."""
+        gs = self.gs
+        rootMoves = validMoves if validMoves is not None else gs.getValidMoves()
+        if not rootMoves:
+            return None
+        rootPly = len(gs.undoStack)
+        bestMove = rootMoves[0]
+        if len(self.transpositionTable) > TT_MAX_ENTRIES:
+            self.transpositionTable.clear()
+        for depth in range(1, self.maxDepth + 1):
+            # Depth 1 always runs to completion so there is a searched move to fall back on
+            if depth == 2 and self.timeLimit is not None:
+                self.deadline = self.startTime + self.timeLimit
+            try:
+                score, move = self.negamax(depth, -math.inf, math.inf, 0, rootMoves)
+            except SearchTimeout:
+                while len(gs.undoStack) > rootPly:  # unwind the aborted iteration
+                    gs.undoMove()
+                break
+            if move is not None:
+                bestMove = move
+            if abs(score) >= MATE_BOUND:
+                break
+        return bestMove
+
+    def evaluate(self):
+        """Material and piece-square score from the side to move's point of view."""
+        score = 0
+        for r, row in enumerate(self.gs.board):
+            for c, square in enumerate(row):
+                if square == "--":
+                    continue
+                table = piecePositionScores.get(square[1])
+                if square[0] == 'w':
+                    score += pieceScore[square[1]] + (table[r][c] if table else 0)
+                else:
+                    score -= pieceScore[square[1]] + (table[7 - r][c] if table else 0)
+        return score if self.gs.whiteToMove else -score
+
+    def checkTime(self):
+        self.nodes += 1
+        if self.nodes & 63 == 0:
+            if self.deadline is not None and time.perf_counter() >= self.deadline:
+                raise SearchTimeout()
+            if self.stopEvent is not None and self.stopEvent.is_set():
+                raise SearchTimeout()
+
+    def orderMoves(self, moves, ttMoveID):
+        def key(move):
+            if move.moveID == ttMoveID:
+                return 100000
+            score = 0
+            if move.isCapture:
+                score += 10000 + pieceScore[move.pieceCaptured[1]] * 10 - pieceScore[move.pieceMoved[1]]
+            if move.pawnPromotion:
+                score += pieceScore[move.promotionPiece]
+            return score
+        return sorted(moves, key=key, reverse=True)
+
+    def negamax(self, depth, alpha, beta, ply, moves=None):
+        self.checkTime()
+        gs = self.gs
+        if moves is None:
+            moves = gs.getValidMoves()
+        if not moves:
+            return (-(CHECKMATE - ply) if gs.inCheck else STALEMATE), None
+        if gs.stalemate and ply > 0:  # draw by repetition, fifty moves or insufficient material
+            return STALEMATE, None
+        if depth == 0:
+            return self.quiescence(alpha, beta, 0, moves, ply), None
+
+        alphaOrig = alpha
+        key = gs.zobristKey
+        entry = self.transpositionTable.get(key)
+        ttMoveID = None
+        if entry is not None:
+            entryDepth, bound, entryScore, ttMoveID = entry
+            entryScore = scoreFromTT(entryScore, ply)
+            if entryDepth >= depth and ply > 0:
+                if bound == EXACT:
+                    return entryScore, None
+                if bound == LOWER:
+                    alpha = max(alpha, entryScore)
+                else:
+                    beta = min(beta, entryScore)
+                if alpha >= beta:
+                    return entryScore, None
+
+        bestScore = -math.inf
+        bestMove = None
+        for move in self.orderMoves(moves, ttMoveID):
+            gs.makeMove(move)
+            score = -self.negamax(depth - 1, -beta, -alpha, ply + 1)[0]
+            gs.undoMove()
+            if score > bestScore:
+                bestScore = score
+                bestMove = move
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                break
+
+        if bestScore <= alphaOrig:
+            bound = UPPER
+        elif bestScore >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        self.transpositionTable[key] = (depth, bound, scoreToTT(bestScore, ply), bestMove.moveID)
+        return bestScore, bestMove
+
+    def quiescence(self, alpha, beta, depth, moves, ply):
+        """
+        Captures only until the position is quiet, so leaves aren't scored mid-exchange. ply is
+        the distance from the root, so a mate found here is scored like one found by negamax.
+        """
+        standPat = self.evaluate()
+        if standPat >= beta or depth >= QUIESCENCE_DEPTH:
+            return standPat
+        alpha = max(alpha, standPat)
+        for move in self.orderMoves([move for move in moves if move.isCapture], None):
+            self.gs.makeMove(move)
+            self.checkTime()
+            replies = self.gs.getValidMoves()
+            if not replies:
+                score = CHECKMATE - (ply + 1) if self.gs.inCheck else STALEMATE
+            else:
+                score = -self.quiescence(-beta, -alpha, depth + 1, replies, ply + 1)
+            self.gs.undoMove()
+            if score >= beta:
+                return score
+            alpha = max(alpha, score)
+        return alpha
+
+
+def findBestMove(gs, validMoves=None, timeLimit=DEFAULT_TIME_LIMIT, maxDepth=MAX_DEPTH, transpositionTable=None,
+                 stopEvent=None):
+    """
+    Search gs and return the best Move from validMoves (the legal moves of gs, generated if not given).
+    gs is searched in place and left in its original position; only the checkmate/stalemate
+    flags are cleared, as after any undoMove. Setting stopEvent ends the search early.
+    """
+    return Searcher(gs, timeLimit, maxDepth, transpositionTable, stopEvent).search(validMoves)
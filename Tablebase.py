@@ -0,0 +1,307 @@
+"""
+Endgame tablebase probing for the AI.
+
+With few pieces left the search asks the tablebases instead of searching: win/draw/loss (WDL)
+at interior nodes and, at the root, the move that keeps the win (or holds out longest) by
+distance to zeroing (Syzygy) or distance to mate (bundled tables). Tables come from one directory:
+
+    TABLEBASE_PATH        directory of Syzygy .rtbw/.rtbz files and/or the bundled KQvK.bin/KRvK.bin
+                          (default: tablebases/ next to this module; no probing if it is missing)
+    TABLEBASE_MAX_PIECES  probe only positions with at most this many pieces, kings included (default 5)
+
+Syzygy files are opened with python-chess, which memory-maps them. The bundled tables are
+memory-mapped too, and WDL probe results are kept in an LRU cache keyed by the Zobrist hash.
+
+The bundled KQK and KRK tables need no download. Generate them with a retrograde analysis:
+
+    python Tablebase.py generate              # writes tablebases/KQvK.bin and KRvK.bin
+    python Tablebase.py probe "8/8/8/4k3/8/8/8/4K2R w - - 0 1"
+"""
+import argparse
+import atexit
+import mmap
+import os
+import sys
+import threading
+from collections import OrderedDict, deque
+
+import chess
+import chess.polyglot
+import chess.syzygy
+
+TABLEBASE_PATH = os.environ.get("TABLEBASE_PATH") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "tablebases")
+TABLEBASE_MAX_PIECES = int(os.environ.get("TABLEBASE_MAX_PIECES", 5))
+TABLEBASE_CACHE_SIZE = 65536
+
+# Bundled tables: one byte per (white king, white piece, black king, side to move) with the plies
+# to mate plus one when white wins, and 0 for draws and illegal positions
+BUNDLED_PIECES = {chess.QUEEN: "KQvK.bin", chess.ROOK: "KRvK.bin"}
+TABLE_SIZE = 64 * 64 * 64 * 2
+
+KING_STEPS = [[to for to in chess.SQUARES if chess.square_distance(sq, to) == 1] for sq in chess.SQUARES]
+ROOK_DIRECTIONS = ((0, 1), (0, -1), (1, 0), (-1, 0))
+BISHOP_DIRECTIONS = ((1, 1), (1, -1), (-1, 1), (-1, -1))
+PIECE_DIRECTIONS = {chess.QUEEN: ROOK_DIRECTIONS + BISHOP_DIRECTIONS, chess.ROOK: ROOK_DIRECTIONS}
+
+
+def _rays(directions):
+    """For each square, the squares along each direction in order, up to the edge of the board."""
+    rays = []
+    for sq in chess.SQUARES:
+        square_rays = []
+        for file_step, rank_step in directions:
+            ray = []
+            file, rank = chess.square_file(sq) + file_step, chess.square_rank(sq) + rank_step
+            while 0 <= file < 8 and 0 <= rank < 8:
+                ray.append(chess.square(file, rank))
+                file, rank = file + file_step, rank + rank_step
+            square_rays.append(ray)
+        rays.append(square_rays)
+    return rays
+
+
+def tableIndex(white_king, white_piece, black_king, black_to_move):
+    return ((white_king * 64 + white_piece) * 64 + black_king) * 2 + black_to_move
+
+
+def generateTable(piece_type):
+    """
+    Retrograde analysis of king and queen/rook against king. Starting from every checkmate, each
+    lost black-to-move position marks the white-to-move positions that lead to it as won one ply
+    further from mate, and a black-to-move position is lost once every black reply is won for white.
+    Processing positions in the order they are decided gives exact distances to mate.
+    """
+    rays = _rays(PIECE_DIRECTIONS[piece_type])
+    table = bytearray(TABLE_SIZE)
+    legal_white_to_move = bytearray(TABLE_SIZE // 2)
+    replies_left = {}  # black-to-move index -> black moves not yet known to lose
+    queue = deque()
+
+    for white_king in chess.SQUARES:
+        near_white_king = set(KING_STEPS[white_king])
+        for white_piece in chess.SQUARES:
+            if white_piece == white_king:
+                continue
+            for black_king in chess.SQUARES:
+                if black_king in (white_king, white_piece) or black_king in near_white_king:
+                    continue
+                # White's attacks with the black king lifted off, so it can't hide behind itself
+                attacked = set(near_white_king)
+                for ray in rays[white_piece]:
+                    for sq in ray:
+                        attacked.add(sq)
+                        if sq == white_king:
+                            break
+                if black_king not in attacked:
+                    legal_white_to_move[tableIndex(white_king, white_piece, black_king, 0) >> 1] = 1
+                replies = 0
+                for to in KING_STEPS[black_king]:
+                    if to == white_piece:
+                        replies += to not in near_white_king  # capturing the piece draws
+                    elif to not in attacked:
+                        replies += 1
+                index = tableIndex(white_king, white_piece, black_king, 1)
+                if replies:
+                    replies_left[index] = replies
+                elif black_king in attacked:  # checkmate
+                    table[index] = 1
+                    queue.append(index)
+
+    while queue:
+        index = queue.popleft()
+        plies = table[index]  # plies to mate of the predecessors, plus one
+        black_to_move = index & 1
+        black_king = index >> 1 & 63
+        white_piece = index >> 7 & 63
+        white_king = index >> 13
+        if black_to_move:
+            # White just moved here: un-move the king, then the piece
+            predecessors = [tableIndex(sq, white_piece, black_king, 0) for sq in KING_STEPS[white_king]
+                            if sq != white_piece and chess.square_distance(sq, black_king) > 1]
+            for ray in rays[white_piece]:
+                for sq in ray:
+                    if sq == white_king or sq == black_king:
+                        break
+                    predecessors.append(tableIndex(white_king, sq, black_king, 0))
+            for predecessor in predecessors:
+                if legal_white_to_move[predecessor >> 1] and not table[predecessor]:
+                    table[predecessor] = plies + 1
+                    queue.append(predecessor)
+        else:
+            # Black just moved here: un-move the black king
+            for sq in KING_STEPS[black_king]:
+                predecessor = tableIndex(white_king, white_piece, sq, 1)
+                if predecessor in replies_left and not table[predecessor] and sq != white_piece:
+                    replies_left[predecessor] -= 1
+                    if not replies_left[predecessor]:
+                        table[predecessor] = plies + 1
+                        queue.append(predecessor)
+    return table
+
+
+def generateBundledTables(directory=TABLEBASE_PATH):
+    os.makedirs(directory, exist_ok=True)
+    for piece_type, file_name in BUNDLED_PIECES.items():
+        with open(os.path.join(directory, file_name), "wb") as table_file:
+            table_file.write(generateTable(piece_type))
+
+
+class EndgameTablebase:
+    """Syzygy tables and the bundled KQK/KRK tables from one directory, with an LRU cache of WDL probes."""
+
+    def __init__(self, directory=TABLEBASE_PATH, max_pieces=TABLEBASE_MAX_PIECES, cache_size=TABLEBASE_CACHE_SIZE):
+        self.max_pieces = max_pieces
+        self.cache_size = cache_size
+        self.cache = OrderedDict()  # zobrist hash -> wdl or None
+        self.lock = threading.Lock()
+        self.syzygy = None
+        self.syzygy_pieces = 0  # pieces in the largest Syzygy table found
+        self.bundled = {}
+        if os.path.isdir(directory):
+            syzygy = chess.syzygy.Tablebase()
+            if syzygy.add_directory(directory):
+                self.syzygy = syzygy
+                self.syzygy_pieces = max(len(name) - 1 for name in syzygy.wdl)  # "KRvK" -> 3
+            for piece_type, file_name in BUNDLED_PIECES.items():
+                path = os.path.join(directory, file_name)
+                if os.path.isfile(path) and os.path.getsize(path) == TABLE_SIZE:
+                    with open(path, "rb") as table_file:
+                        self.bundled[piece_type] = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def available(self):
+        return self.syzygy is not None or bool(self.bundled)
+
+    def covers(self, board):
+        """Whether some table holds the position, judged from the material alone so the search can ask cheaply."""
+        pieces = chess.popcount(board.occupied)
+        if pieces > self.max_pieces:
+            return False
+        if pieces <= self.syzygy_pieces:
+            return True
+        return pieces == 3 and any(board.pieces_mask(piece_type, color)
+                                   for piece_type in self.bundled for color in chess.COLORS)
+
+    def probeWdl(self, board):
+        """
+        Win/draw/loss for the side to move: 2 for a win, 0 for a draw and -2 for a loss (Syzygy's
+        1/-1 are wins/losses spoiled by the fifty-move rule), or None if no table holds the position.
+        Only WDL tables are read, and results are cached, so this is the probe for interior nodes.
+        """
+        key = chess.polyglot.zobrist_hash(board)
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+        result = self.probeBundled(board)
+        if result is not None:
+            wdl = result[0]
+        elif self.syzygy is not None:
+            wdl = self.syzygy.get_wdl(board)
+        else:
+            wdl = None
+        with self.lock:
+            self.cache[key] = wdl
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return wdl
+
+    def probe(self, board):
+        """
+        (wdl, distance) for the side to move, or None if no table holds the position. distance is
+        plies to mate for bundled tables and Syzygy's DTZ otherwise. DTZ probes are slow, so this is for the root only.
+        """
+        result = self.probeBundled(board)
+        if result is None and self.syzygy is not None:
+            try:
+                result = (self.syzygy.probe_wdl(board), self.syzygy.probe_dtz(board))
+            except (KeyError, chess.syzygy.MissingTableError):
+                result = None
+        return result
+
+    def probeBundled(self, board):
+        if chess.popcount(board.occupied) == 2:
+            return 0, 0  # bare kings
+        if chess.popcount(board.occupied) != 3 or board.castling_rights:
+            return None
+        strong = chess.WHITE if chess.popcount(board.occupied_co[chess.WHITE]) == 2 else chess.BLACK
+        piece_type = next((piece for piece in self.bundled if board.pieces_mask(piece, strong)), None)
+        if piece_type is None:
+            return None
+        if strong == chess.BLACK:
+            board = board.mirror()  # the tables are stored with white as the stronger side
+        value = self.bundled[piece_type][tableIndex(board.king(chess.WHITE), board.pieces(piece_type, chess.WHITE).pop(),
+                                                    board.king(chess.BLACK), board.turn == chess.BLACK)]
+        if not value:
+            return 0, 0
+        return (2 if board.turn == chess.WHITE else -2), value - 1
+
+    def bestMove(self, board):
+        """
+        The root move to play: the best WDL for the side to move, then the fastest win or the
+        slowest loss. None if the position or one of its replies is not covered.
+        """
+        best, best_key = None, None
+        for move in board.legal_moves:
+            board.push(move)
+            if board.is_checkmate():
+                board.pop()
+                return move
+            result = self.probe(board)
+            board.pop()
+            if result is None:
+                return None
+            wdl, distance = result
+            # Winning: the reply should be as close to losing as possible. Losing: as far from winning.
+            key = (-wdl, -abs(distance) if wdl < 0 else abs(distance))
+            if best_key is None or key > best_key:
+                best, best_key = move, key
+        return best
+
+    def close(self):
+        if self.syzygy is not None:
+            self.syzygy.close()
+        for table in self.bundled.values():
+            table.close()
+        self.bundled = {}
+
+
+_tablebase = None
+_tablebase_lock = threading.Lock()
+
+
+def getTablebase():
+    """Return the shared tablebase, opened on first use."""
+    global _tablebase
+    with _tablebase_lock:
+        if _tablebase is None:
+            _tablebase = EndgameTablebase()
+            atexit.register(_tablebase.close)
+        return _tablebase
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the bundled KQK/KRK tables or probe a position")
+    commands = parser.add_subparsers(dest="command", required=True)
+    generate = commands.add_parser("generate", help="write KQvK.bin and KRvK.bin")
+    generate.add_argument("--out", default=TABLEBASE_PATH, help="output directory (default TABLEBASE_PATH)")
+    probe = commands.add_parser("probe", help="print WDL, distance and best move for a FEN")
+    probe.add_argument("fen")
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        generateBundledTables(args.out)
+        print(f"wrote {', '.join(BUNDLED_PIECES.values())} to {args.out}")
+        return 0
+    board = chess.Board(args.fen)
+    tablebase = getTablebase()
+    result = tablebase.probe(board)
+    if result is None:
+        print("not in the tablebases")
+        return 1
+    move = tablebase.bestMove(board)
+    print(f"wdl {result[0]}  distance {result[1]}  best move {move.uci() if move else '-'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())